@@ -5,6 +5,9 @@ from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKey
 from aiogram.filters import Command
 
 from .storage import ConfigStore
+from .audit import SubscriptionAudit
+from .stats import render_stats
+from .subscription import SubscriptionService
 import logging
 
 
@@ -50,7 +53,12 @@ def settings_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
-def setup_admin(store: ConfigStore, admin_user_ids: set[int]) -> Router:
+def setup_admin(
+    store: ConfigStore,
+    admin_user_ids: set[int],
+    audit: SubscriptionAudit | None = None,
+    subs: SubscriptionService | None = None,
+) -> Router:
     # Если список админов пуст, разрешаем действия любому пользователю (для первичной настройки)
     admins = set(admin_user_ids or [])
 
@@ -106,6 +114,33 @@ def setup_admin(store: ConfigStore, admin_user_ids: set[int]) -> Router:
         await message.answer("Список обязательных подписок:\n" + "\n".join(lines))
         logger.debug("channels listed: %s", lines)
 
+    # Живая статистика нагрузки из внутренних счётчиков
+    @router.message(Command("stats"))
+    async def show_stats(message: Message) -> None:
+        if is_not_authorized(message.from_user.id if message.from_user else None):
+            return
+        await message.answer(render_stats(subs))
+
+    # Перепроверка всех известных участников после смены списка каналов
+    @router.message(Command("audit"))
+    async def start_audit(message: Message, bot: Bot) -> None:
+        if is_not_authorized(message.from_user.id if message.from_user else None):
+            return
+        if audit is None:
+            await message.answer("Аудит не настроен")
+            return
+        if not audit.start(bot, message.chat.id):
+            await message.answer("Аудит уже идёт")
+            return
+        logger.info("audit started by %s", message.from_user.id if message.from_user else None)
+
+    @router.message(Command("audit_stop"))
+    async def stop_audit(message: Message) -> None:
+        if is_not_authorized(message.from_user.id if message.from_user else None):
+            return
+        if audit is None or not audit.stop():
+            await message.answer("Аудит не запущен")
+
     # Ручной способ добавления/удаления убран; используем только системный выбор
 
     # Обработка выбора чата через request_chat
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import List, Optional, Set
+
+from aiogram import Bot
+
+from .metrics import metrics
+from .ratelimit import TokenBucket
+from .subscription import SubscriptionService
+
+
+logger = logging.getLogger("audit")
+
+
+class ParticipantRegistry:
+    """Список ID пользователей, замеченных в целевом чате.
+
+    Хранится в текстовом файле (по ID на строку); новые ID копятся
+    в памяти и дописываются в файл пачкой через `flush()`.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._ids: Set[int] = set()
+        self._pending: List[int] = []
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line.lstrip("-").isdigit():
+                        self._ids.add(int(line))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, user_id: int) -> None:
+        if user_id in self._ids:
+            return
+        self._ids.add(user_id)
+        self._pending.append(user_id)
+
+    def snapshot(self) -> List[int]:
+        return sorted(self._ids)
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(f"{uid}\n" for uid in pending))
+
+    async def run_flusher(self, interval_seconds: float = 30.0) -> None:
+        """Фоновая задача: периодически сбрасывает новые ID на диск."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                self.flush()
+            except OSError:
+                logger.exception("participants flush failed")
+
+
+class SubscriptionAudit:
+    """Фоновая перепроверка подписки всех известных участников чата.
+
+    Идёт по отсортированному списку ID с ограничением скорости
+    (`rate_per_second` запросов getChatMember), записывает вердикты
+    в кэш `SubscriptionService` и сохраняет курсор в `state_path`,
+    чтобы после перезапуска продолжить с того же места.
+    """
+
+    def __init__(
+        self,
+        subs: SubscriptionService,
+        registry: ParticipantRegistry,
+        state_path: str,
+        rate_per_second: float = 15.0,
+        verdict_ttl_seconds: Optional[int] = None,
+        report_every_seconds: float = 30.0,
+    ) -> None:
+        self.subs = subs
+        self.registry = registry
+        self.state_path = state_path
+        self.bucket = TokenBucket(rate_per_second)
+        # None или 0 — срок вердикта как у SubscriptionService
+        self.verdict_ttl_seconds = verdict_ttl_seconds or None
+        self.report_every_seconds = report_every_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, bot: Bot, report_chat_id: int) -> bool:
+        """Запустить аудит. Возвращает False, если он уже идёт."""
+        if self.running:
+            return False
+        self._task = asyncio.create_task(self._run(bot, report_chat_id))
+        return True
+
+    def stop(self) -> bool:
+        if not self.running:
+            return False
+        assert self._task is not None
+        self._task.cancel()
+        return True
+
+    def _load_state(self, channels: List[str]) -> dict:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        # Продолжаем только незавершённый аудит того же набора каналов
+        if isinstance(state, dict) and state.get("channels") == channels and not state.get("finished"):
+            return state
+        return {"channels": channels, "last_user_id": None, "checked": 0, "unsubscribed": 0, "finished": False}
+
+    def _write_state(self, payload: str) -> None:
+        """Атомарная запись курсора (выполняется вне event loop)."""
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.state_path)
+
+    async def _save_state(self, state: dict) -> None:
+        # Снимок сериализуем здесь: цикл аудита продолжит менять state
+        payload = json.dumps(state)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._write_state, payload)
+        except OSError:
+            logger.exception("audit state write failed: %s", self.state_path)
+
+    async def _run(self, bot: Bot, report_chat_id: int) -> None:
+        version = self.subs.channels_version()
+        channels = await self.subs.current_channels()
+        state = self._load_state(channels)
+        user_ids = self.registry.snapshot()
+        last = state["last_user_id"]
+        if last is not None:
+            user_ids = [uid for uid in user_ids if uid > last]
+        total = state["checked"] + len(user_ids)
+        resumed = last is not None
+        await self._report(
+            bot, report_chat_id,
+            f"Аудит подписок {'продолжен' if resumed else 'запущен'}: {state['checked']}/{total}, каналов: {len(channels)}",
+        )
+        started = time.monotonic()
+        checked_here = 0
+        last_report = started
+        try:
+            for uid in user_ids:
+                while True:
+                    # Каждый пользователь стоит len(channels) запросов getChatMember
+                    await self.bucket.acquire(max(1, len(channels)))
+                    verdict = await self.subs.verify(uid, channels)
+                    if verdict is not None:
+                        break
+                    # API недоступно или упёрлись в лимит — притормаживаем и повторяем
+                    metrics.inc("audit.backoff")
+                    self.bucket.penalize(5.0)
+                await self.subs.store_verdict(uid, verdict, self.verdict_ttl_seconds, version=version)
+                state["checked"] += 1
+                state["last_user_id"] = uid
+                if not verdict:
+                    state["unsubscribed"] += 1
+                checked_here += 1
+                metrics.inc("audit.checked")
+                now = time.monotonic()
+                if now - last_report >= self.report_every_seconds:
+                    last_report = now
+                    await self._save_state(state)
+                    rate = checked_here / max(now - started, 1e-6)
+                    await self._report(
+                        bot, report_chat_id,
+                        f"Аудит: {state['checked']}/{total}, не подписаны: {state['unsubscribed']}, {rate:.1f} польз./с",
+                    )
+        except asyncio.CancelledError:
+            await self._save_state(state)
+            await self._report(bot, report_chat_id, f"Аудит остановлен на {state['checked']}/{total}; /audit продолжит")
+            raise
+        except Exception:
+            logger.exception("audit failed at %s/%s", state["checked"], total)
+            await self._save_state(state)
+            await self._report(
+                bot, report_chat_id,
+                f"Аудит прерван на {state['checked']}/{total} из-за ошибки (подробности в логе); /audit продолжит",
+            )
+            return
+        state["finished"] = True
+        await self._save_state(state)
+        elapsed = time.monotonic() - started
+        rate = checked_here / max(elapsed, 1e-6)
+        await self._report(
+            bot, report_chat_id,
+            f"Аудит завершён: проверено {state['checked']}, не подписаны: {state['unsubscribed']}, "
+            f"{elapsed:.0f} с, {rate:.1f} польз./с",
+        )
+        logger.info("audit finished: checked=%s unsubscribed=%s", state["checked"], state["unsubscribed"])
+
+    async def _report(self, bot: Bot, chat_id: int, text: str) -> None:
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+        except Exception:
+            logger.debug("audit report to %s failed", chat_id)
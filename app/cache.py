@@ -1,24 +1,40 @@
+import sys
 import time
-from typing import Dict, Optional, Any, Tuple
+from typing import Callable, Dict, Generic, Hashable, Optional, Any, TypeVar
 from asyncio import Lock
 
 
+# Оценка памяти на объекты одной записи сверх самого словаря: int-ключ и float-срок
+_ENTRY_OBJECTS_BYTES = sys.getsizeof(2 ** 40) + sys.getsizeof(0.0)
+
+
 class TTLMemoryCache:
     """Маленький TTL-кэш в памяти процесса.
 
     Достаточно для одного процесса бота. Для кластера замените на Redis
-    с тем же интерфейсом.
+    с тем же интерфейсом. Ключ — любое хешируемое значение; для больших
+    чатов используйте целые ключи (user_id) в таблицах `ScopedCache`,
+    а не форматированные строки.
     """
 
+    __slots__ = ("_data", "_lock")
+
     def __init__(self) -> None:
-        self._data: Dict[str, float] = {}
+        self._data: Dict[Hashable, float] = {}
         self._lock = Lock()
 
-    async def set_until(self, key: str, ttl_seconds: int) -> None:
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def approx_bytes(self) -> int:
+        """Оценка занимаемой памяти без обхода записей."""
+        return sys.getsizeof(self._data) + len(self._data) * _ENTRY_OBJECTS_BYTES
+
+    async def set_until(self, key: Hashable, ttl_seconds: int) -> None:
         async with self._lock:
             self._data[key] = time.monotonic() + float(ttl_seconds)
 
-    async def contains(self, key: str) -> bool:
+    async def contains(self, key: Hashable) -> bool:
         async with self._lock:
             now = time.monotonic()
             exp = self._data.get(key)
@@ -30,7 +46,7 @@ class TTLMemoryCache:
                 return False
             return True
 
-    async def get_remaining(self, key: str) -> Optional[float]:
+    async def get_remaining(self, key: Hashable) -> Optional[float]:
         async with self._lock:
             exp = self._data.get(key)
             if exp is None:
@@ -41,35 +57,92 @@ class TTLMemoryCache:
                 return None
             return remaining
 
+    async def delete(self, key: Hashable) -> None:
+        async with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
 
 class TTLKVCache:
     """Простой TTL-кэш ключ→значение в памяти процесса.
 
     Хранит произвольные значения до истечения срока. Предназначен
-    для эфемерного использования во время работы процесса.
+    для эфемерного использования во время работы процесса. Срок и
+    значение лежат в двух параллельных словарях, без кортежа на запись.
     """
 
+    __slots__ = ("_expires", "_values", "_lock")
+
     def __init__(self) -> None:
-        self._data: Dict[str, Tuple[float, Any]] = {}
+        self._expires: Dict[Hashable, float] = {}
+        self._values: Dict[Hashable, Any] = {}
         self._lock = Lock()
 
-    async def set(self, key: str, value: Any, ttl_seconds: int) -> None:
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def approx_bytes(self) -> int:
+        """Оценка занимаемой памяти без обхода записей (значения считаются небольшими int)."""
+        entries = len(self._expires)
+        return (
+            sys.getsizeof(self._expires)
+            + sys.getsizeof(self._values)
+            + entries * (_ENTRY_OBJECTS_BYTES + sys.getsizeof(2 ** 40))
+        )
+
+    async def set(self, key: Hashable, value: Any, ttl_seconds: int) -> None:
         async with self._lock:
-            self._data[key] = (time.monotonic() + float(ttl_seconds), value)
+            self._expires[key] = time.monotonic() + float(ttl_seconds)
+            self._values[key] = value
 
-    async def get(self, key: str) -> Optional[Any]:
+    async def get(self, key: Hashable) -> Optional[Any]:
         async with self._lock:
-            item = self._data.get(key)
-            if item is None:
+            exp = self._expires.get(key)
+            if exp is None:
                 return None
-            exp, value = item
             if exp < time.monotonic():
-                self._data.pop(key, None)
+                self._expires.pop(key, None)
+                self._values.pop(key, None)
                 return None
-            return value
+            return self._values.get(key)
 
-    async def delete(self, key: str) -> None:
+    async def delete(self, key: Hashable) -> None:
         async with self._lock:
-            self._data.pop(key, None)
+            self._expires.pop(key, None)
+            self._values.pop(key, None)
+
+    def clear(self) -> None:
+        self._expires.clear()
+        self._values.clear()
+
+
+C = TypeVar("C")
+
+
+class ScopedCache(Generic[C]):
+    """Набор отдельных таблиц кэша по пространствам имён (например, по chat_id).
+
+    Вместо ключа `f"notice:{chat_id}:{user_id}"` используется
+    `cache.table(chat_id)` с целым ключом `user_id`: не нужно
+    форматировать строку на каждый поиск, а запись занимает в разы меньше памяти.
+    """
+
+    __slots__ = ("_factory", "_tables")
+
+    def __init__(self, factory: Callable[[], C]) -> None:
+        self._factory = factory
+        self._tables: Dict[Hashable, C] = {}
+
+    def table(self, scope: Hashable) -> C:
+        table = self._tables.get(scope)
+        if table is None:
+            table = self._tables[scope] = self._factory()
+        return table
 
+    def __len__(self) -> int:
+        return sum(len(t) for t in self._tables.values())  # type: ignore[arg-type]
 
+    def approx_bytes(self) -> int:
+        return sys.getsizeof(self._tables) + sum(t.approx_bytes() for t in self._tables.values())  # type: ignore[attr-defined]
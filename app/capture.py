@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from .metrics import metrics
+
+
+logger = logging.getLogger("capture")
+
+FILE_PATTERN = "capture-*.jsonl.gz"
+# Текстовые поля заменяются строкой той же длины
+_MASKED_FIELDS = ("text", "caption")
+_NAME_FIELDS = ("first_name", "last_name", "username")
+
+
+def _anonymize(value: Any, hash_id: Callable[[int], int]) -> Any:
+    """Копия апдейта с хешированными ID пользователей и скрытыми текстами.
+
+    Пользователь распознаётся по полю `is_bot`, личный чат — по типу
+    `private`; ID групп и каналов остаются как есть, иначе запись
+    нельзя проиграть против настроенного целевого чата.
+    """
+    if isinstance(value, list):
+        return [_anonymize(v, hash_id) for v in value]
+    if not isinstance(value, dict):
+        return value
+    result = {k: _anonymize(v, hash_id) for k, v in value.items()}
+    is_user = "is_bot" in value
+    if (is_user or value.get("type") == "private") and isinstance(value.get("id"), int):
+        result["id"] = hash_id(value["id"])
+    if is_user or value.get("type") == "private":
+        for name in _NAME_FIELDS:
+            if name in result:
+                result[name] = "user"
+    for name in _MASKED_FIELDS:
+        if isinstance(result.get(name), str):
+            result[name] = "x" * len(result[name])
+    return result
+
+
+class CaptureWriter:
+    """Кольцо сжатых JSONL-файлов с сырыми апдейтами для последующего воспроизведения.
+
+    Апдейты копятся в памяти и дописываются пачкой в текущий файл
+    `capture-NNNNNN.jsonl.gz` вне event loop (каждая пачка — отдельный
+    gzip-член). Файл закрывается, когда превышает `max_bytes / max_files`;
+    самые старые файлы удаляются, чтобы их было не больше `max_files`.
+    ID пользователей хешируются с солью `salt` (одинаково в пределах записи).
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024, max_files: int = 8, salt: str = "") -> None:
+        self.directory = directory
+        self.max_files = max(2, int(max_files))
+        self.file_bytes = max(1, int(max_bytes) // self.max_files)
+        self._salt = (salt or os.urandom(16).hex()).encode()
+        self._pending: List[Tuple[float, Dict[str, Any]]] = []
+        # Запись из фоновой задачи и финальный flush при остановке не должны пересекаться
+        self._write_lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        existing = sorted(glob.glob(os.path.join(self.directory, FILE_PATTERN)))
+        self._seq = int(os.path.basename(existing[-1])[8:14]) if existing else 0
+        self._path = self._next_path()
+
+    def _next_path(self) -> str:
+        self._seq += 1
+        return os.path.join(self.directory, f"capture-{self._seq:06d}.jsonl.gz")
+
+    def _hash_id(self, user_id: int) -> int:
+        digest = hashlib.blake2b(str(user_id).encode(), digest_size=6, key=self._salt).digest()
+        return int.from_bytes(digest, "big")
+
+    def add(self, update: Update) -> None:
+        self._pending.append((time.time(), update.model_dump(mode="json", exclude_none=True, by_alias=True)))
+
+    def _write(self, batch: List[Tuple[float, Dict[str, Any]]]) -> None:
+        lines = "".join(
+            json.dumps({"t": received, "update": _anonymize(raw, self._hash_id)}, ensure_ascii=False) + "\n"
+            for received, raw in batch
+        )
+        with self._write_lock:
+            with gzip.open(self._path, "at", encoding="utf-8") as f:
+                f.write(lines)
+            if os.path.getsize(self._path) >= self.file_bytes:
+                self._path = self._next_path()
+                files = sorted(glob.glob(os.path.join(self.directory, FILE_PATTERN)))
+                for old in files[: max(0, len(files) - self.max_files + 1)]:
+                    os.remove(old)
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        await asyncio.get_running_loop().run_in_executor(None, self._write, batch)
+        metrics.inc("capture.written", len(batch))
+
+    async def run_flusher(self, interval_seconds: float = 1.0) -> None:
+        """Фоновая задача: периодически сбрасывает накопленные апдейты на диск."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.flush()
+            except OSError:
+                logger.exception("capture flush failed: %s", self.directory)
+
+
+class CaptureMiddleware(BaseMiddleware):
+    """Внешняя middleware апдейтов: записывает каждый апдейт до обработки."""
+
+    def __init__(self, writer: CaptureWriter) -> None:
+        self.writer = writer
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Update):
+            self.writer.add(event)
+        return await handler(event, data)
+
+
+def read_capture(directory: str) -> Iterator[Tuple[float, Dict[str, Any]]]:
+    """Записи (время получения, апдейт) из всех файлов кольца по порядку."""
+    for path in sorted(glob.glob(os.path.join(directory, FILE_PATTERN))):
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        yield float(record["t"]), record["update"]
+        except (OSError, EOFError, ValueError):
+            # Файл, который писался в момент остановки, может быть обрезан
+            logger.warning("capture file truncated: %s", path)
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.types import Message
+
+from .metrics import metrics
+from .overload import OverloadController
+from .subscription import SubscriptionService
+
+
+logger = logging.getLogger("catchup")
+
+# Ограничение Bot API на один вызов deleteMessages
+DELETE_BATCH_LIMIT = 100
+# Сколько раз подряд возвращать в очередь пачку чата после сбоя, прежде чем отказаться
+MAX_FLUSH_ATTEMPTS = 3
+
+
+class CatchUpBatcher:
+    """Режим догоняния после простоя: пачечная обработка устаревших апдейтов.
+
+    Сообщение считается устаревшим, если оно старше `threshold_seconds`.
+    Такие сообщения не проходят обычный путь (приветствия, напоминания),
+    а копятся по чату и пользователю; через `flush_delay` секунд
+    каждый пользователь проверяется один раз, а сообщения неподписанных
+    удаляются вызовами deleteMessages по 100 штук. Первое свежее
+    сообщение завершает режим и сразу сбрасывает накопленное, а также
+    ступень деградации `overload`: бэклог не должен её удерживать.
+    Если проверка или удаление сорвались из-за сбоя (не отмены),
+    пачка возвращается в очередь, но не больше `MAX_FLUSH_ATTEMPTS` раз подряд.
+    """
+
+    def __init__(
+        self,
+        subs: SubscriptionService,
+        threshold_seconds: float = 60.0,
+        flush_delay: float = 1.0,
+        overload: Optional[OverloadController] = None,
+    ) -> None:
+        self.subs = subs
+        self.overload = overload
+        self.threshold_seconds = threshold_seconds
+        self.flush_delay = flush_delay
+        self.active = False
+        self._pending: Dict[int, Dict[int, List[int]]] = {}
+        self._bots: Dict[int, Bot] = {}
+        self._flush_tasks: Dict[int, asyncio.Task] = {}
+        # Сильные ссылки на все сбросы, включая немедленные, до их завершения
+        self._running: Set[asyncio.Task] = set()
+        self._attempts: Dict[int, int] = {}
+        metrics.set_gauge("catchup.active", 0)
+
+    def is_stale(self, date: Optional[datetime]) -> bool:
+        """Проверить возраст события и переключить режим догоняния."""
+        if date is None:
+            return False
+        stale = time.time() - date.timestamp() > self.threshold_seconds
+        if stale and not self.active:
+            self.active = True
+            metrics.set_gauge("catchup.active", 1)
+            logger.warning("catch-up mode on: updates older than %.0fs", self.threshold_seconds)
+        elif not stale and self.active:
+            self.active = False
+            metrics.set_gauge("catchup.active", 0)
+            logger.info("catch-up mode off: caught up")
+            if self.overload is not None:
+                self.overload.reset()
+            # Догнали — не ждём таймеров, разбираем остаток сразу
+            for chat_id in list(self._pending):
+                self._schedule(chat_id, delay=0.0)
+        return stale
+
+    def submit(self, message: Message) -> None:
+        """Отложить устаревшее сообщение до пачечной обработки."""
+        if message.from_user is None:
+            return
+        chat_id = message.chat.id
+        by_user = self._pending.setdefault(chat_id, {})
+        by_user.setdefault(message.from_user.id, []).append(message.message_id)
+        self._bots[chat_id] = message.bot  # type: ignore[assignment]
+        metrics.inc("catchup.batched")
+        # Уже запланированный сброс не переносится; завершённая задача не мешает новой
+        self._schedule(chat_id, delay=self.flush_delay)
+
+    def _schedule(self, chat_id: int, delay: float) -> None:
+        task = self._flush_tasks.get(chat_id)
+        if task is not None and not task.done():
+            if delay > 0:
+                return
+            task.cancel()
+        task = asyncio.create_task(self._flush_later(chat_id, delay))
+        if not task.done():
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+        # Отменять имеет смысл только ожидающий сброс; немедленный не запоминаем
+        # (с eager-фабрикой задача к этому моменту может уже выполняться)
+        if delay > 0:
+            self._flush_tasks[chat_id] = task
+        else:
+            self._flush_tasks.pop(chat_id, None)
+
+    async def _flush_later(self, chat_id: int, delay: float) -> None:
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+        if self._flush_tasks.get(chat_id) is asyncio.current_task():
+            del self._flush_tasks[chat_id]
+        await self.flush(chat_id)
+
+    async def flush(self, chat_id: int) -> None:
+        by_user = self._pending.pop(chat_id, None)
+        bot = self._bots.pop(chat_id, None)
+        if not by_user or bot is None:
+            return
+        to_delete: List[int] = []
+        owners: Dict[int, int] = {}
+        try:
+            for user_id, message_ids in by_user.items():
+                # Одна проверка на пользователя вместо проверки на каждое сообщение
+                if not await self.subs.is_fully_subscribed(user_id):
+                    to_delete.extend(message_ids)
+                    owners.update((mid, user_id) for mid in message_ids)
+        except Exception:
+            logger.exception("catch-up check failed in chat %s", chat_id)
+            self._requeue(chat_id, bot, by_user)
+            return
+        failed: Dict[int, List[int]] = {}
+        for start in range(0, len(to_delete), DELETE_BATCH_LIMIT):
+            chunk = to_delete[start:start + DELETE_BATCH_LIMIT]
+            try:
+                await bot.delete_messages(chat_id=chat_id, message_ids=chunk)
+            except (TelegramNetworkError, TelegramServerError, TelegramRetryAfter):
+                # Временный сбой API — удалим при следующем сбросе
+                for mid in chunk:
+                    failed.setdefault(owners[mid], []).append(mid)
+                continue
+            except Exception:
+                # Ответ API (нет прав, сообщения уже нет) — повтор ничего не даст
+                logger.debug("delete_messages failed in chat %s", chat_id)
+                continue
+            metrics.inc("catchup.deleted", len(chunk))
+            metrics.inc("messages.deleted", len(chunk))
+        if failed:
+            self._requeue(chat_id, bot, failed)
+        else:
+            self._attempts.pop(chat_id, None)
+        messages = sum(len(ids) for ids in by_user.values())
+        retried = sum(len(ids) for ids in failed.values())
+        logger.info(
+            "catch-up batch in chat %s: %s messages from %s users, deleted %s, retry %s",
+            chat_id, messages, len(by_user), len(to_delete) - retried, retried,
+        )
+
+    def _requeue(self, chat_id: int, bot: Bot, by_user: Dict[int, List[int]]) -> None:
+        """Вернуть несброшенные сообщения в очередь чата и запланировать повтор."""
+        attempts = self._attempts.get(chat_id, 0) + 1
+        messages = sum(len(ids) for ids in by_user.values())
+        if attempts > MAX_FLUSH_ATTEMPTS:
+            self._attempts.pop(chat_id, None)
+            metrics.inc("catchup.dropped", messages)
+            logger.warning("catch-up batch in chat %s dropped after %s attempts: %s messages", chat_id, attempts - 1, messages)
+            return
+        self._attempts[chat_id] = attempts
+        pending = self._pending.setdefault(chat_id, {})
+        for user_id, message_ids in by_user.items():
+            pending.setdefault(user_id, [])[:0] = message_ids
+        self._bots.setdefault(chat_id, bot)
+        metrics.inc("catchup.requeued", messages)
+        self._schedule(chat_id, delay=self.flush_delay)
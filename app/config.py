@@ -1,10 +1,11 @@
 import os
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
 
 from dotenv import load_dotenv
 
 DEFAULT_STORE_PATH = os.getenv("CONFIG_STORE_PATH", os.path.join(os.path.dirname(__file__), "..", "data", "config.json"))
+DEFAULT_DATA_DIR = os.path.dirname(os.path.abspath(DEFAULT_STORE_PATH))
 
 @dataclass
 class Settings:
@@ -18,8 +19,62 @@ class Settings:
     required_channels: List[str]
     chat_id: Optional[int]
     cache_ttl_seconds: int = 10
+    # Адаптивный срок вердикта: растёт в growth раз при каждой повторной проверке, до max
+    cache_ttl_max_seconds: int = 300
+    cache_ttl_growth: float = 2.0
     notify_ttl_seconds: int = 10
     config_store_path: str = DEFAULT_STORE_PATH
+    # HTTP-сессия Bot API
+    http_pool_size: int = 100
+    http_keepalive_seconds: float = 30.0
+    http_dns_ttl_seconds: int = 300
+    http_timeout_seconds: float = 60.0
+    http_method_timeouts: Dict[str, float] = field(default_factory=dict)
+    # Автомат отключения проверок подписки при деградации API
+    breaker_failure_threshold: int = 5
+    breaker_reset_seconds: float = 30.0
+    # allow — пропускать сообщения, deny — удалять, пока API недоступно
+    member_check_fail_policy: str = "allow"
+    # Фоновый аудит подписок известных участников
+    participants_path: str = os.path.join(DEFAULT_DATA_DIR, "participants.txt")
+    audit_state_path: str = os.path.join(DEFAULT_DATA_DIR, "audit_state.json")
+    audit_rate_per_second: float = 15.0
+    # Срок вердикта аудита; 0 — как у проверки подписки (SUB_CHECK_CACHE_TTL)
+    audit_verdict_ttl_seconds: int = 0
+    # Деградация при перегрузке: пороги отставания (сек) и активных обработчиков по ступеням
+    overload_enabled: bool = True
+    overload_lag_thresholds: List[float] = field(default_factory=lambda: [2.0, 5.0, 15.0, 30.0])
+    overload_inflight_thresholds: List[int] = field(default_factory=lambda: [50, 100, 200, 400])
+    overload_recover_seconds: float = 5.0
+    overload_lag_window_seconds: float = 5.0
+    # Вспомогательные боты (админы обязательных каналов) для проверок подписки
+    helper_bot_tokens: List[str] = field(default_factory=list)
+    helper_token_rate: float = 20.0
+    # Режим догоняния: события старше порога (сек) обрабатываются пачками; 0 — отключить
+    catchup_threshold_seconds: float = 60.0
+    # Эскалация: после N удалений за окно (сек) — временный запрет писать; 0 — отключить
+    restrict_after_deletes: int = 0
+    restrict_window_seconds: float = 60.0
+    restrict_max_seconds: int = 86400
+    # Webhook-воркер (python -m app.webhook) и адрес Bot API (пусто — api.telegram.org)
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_path: str = "/webhook"
+    webhook_secret: str = ""
+    telegram_api_url: str = ""
+    # Заранее разрешённые ссылки на каналы с числовым ID
+    channel_meta_path: str = os.path.join(DEFAULT_DATA_DIR, "channels_meta.json")
+    # Запись сырых апдейтов для воспроизведения (bench.replay); пустой каталог — отключено
+    capture_dir: str = ""
+    capture_max_bytes: int = 64 * 1024 * 1024
+    capture_max_files: int = 8
+    capture_salt: str = ""
+    # Журнал решений по недавним сообщениям: записей на пользователя (0 — отключить)
+    # и за сколько секунд удалять пропущенное при смене вердикта на «не подписан»
+    ledger_per_user: int = 20
+    ledger_retro_seconds: int = 60
+    # Цикл событий: auto | asyncio | uvloop | eager | uvloop+eager (см. app.runtime)
+    runtime_mode: str = "asyncio"
 
 
 def _parse_required_channels(env_value: str) -> List[str]:
@@ -41,6 +96,28 @@ def _parse_required_channels(env_value: str) -> List[str]:
     return normalized
 
 
+def _parse_method_timeouts(env_value: str) -> Dict[str, float]:
+    """Разбирает строку вида `getChatMember:5,sendMessage:15`."""
+    result: Dict[str, float] = {}
+    for part in (env_value or "").split(","):
+        name, sep, value = part.partition(":")
+        if not sep or not name.strip():
+            continue
+        try:
+            result[name.strip()] = float(value)
+        except ValueError:
+            continue
+    return result
+
+
+def _parse_numbers(env_value: str, default: List[float]) -> List[float]:
+    try:
+        values = [float(p) for p in (env_value or "").split(",") if p.strip()]
+    except ValueError:
+        return list(default)
+    return values or list(default)
+
+
 def load_settings() -> Settings:
     load_dotenv()
 
@@ -62,13 +139,59 @@ def load_settings() -> Settings:
     cache_ttl = int(os.getenv("SUB_CHECK_CACHE_TTL", "10"))
     notify_ttl = int(os.getenv("NOTICE_REPEAT_TTL", "10"))
 
+    method_timeouts = {"getChatMember": float(os.getenv("MEMBER_CHECK_TIMEOUT", "5"))}
+    method_timeouts.update(_parse_method_timeouts(os.getenv("HTTP_METHOD_TIMEOUTS", "")))
+    fail_policy = os.getenv("MEMBER_CHECK_FAIL_POLICY", "allow").strip().lower()
+    if fail_policy not in {"allow", "deny"}:
+        fail_policy = "allow"
+
     return Settings(
         bot_token=bot_token,
         required_channels=channels,
         chat_id=chat_id_val,
         cache_ttl_seconds=cache_ttl,
+        cache_ttl_max_seconds=int(os.getenv("SUB_CHECK_CACHE_TTL_MAX", "300")),
+        cache_ttl_growth=float(os.getenv("SUB_CHECK_TTL_GROWTH", "2")),
         notify_ttl_seconds=notify_ttl,
         config_store_path=os.path.abspath(DEFAULT_STORE_PATH),
+        http_pool_size=int(os.getenv("HTTP_POOL_SIZE", "100")),
+        http_keepalive_seconds=float(os.getenv("HTTP_KEEPALIVE", "30")),
+        http_dns_ttl_seconds=int(os.getenv("HTTP_DNS_TTL", "300")),
+        http_timeout_seconds=float(os.getenv("HTTP_TIMEOUT", "60")),
+        http_method_timeouts=method_timeouts,
+        breaker_failure_threshold=int(os.getenv("BREAKER_FAILURES", "5")),
+        breaker_reset_seconds=float(os.getenv("BREAKER_RESET", "30")),
+        member_check_fail_policy=fail_policy,
+        audit_rate_per_second=float(os.getenv("AUDIT_RATE", "15")),
+        audit_verdict_ttl_seconds=int(os.getenv("AUDIT_VERDICT_TTL", "0")),
+        overload_enabled=os.getenv("OVERLOAD_CONTROL", "1").strip().lower() not in {"0", "false", "no", "off"},
+        overload_lag_thresholds=_parse_numbers(os.getenv("OVERLOAD_LAG_THRESHOLDS", ""), [2.0, 5.0, 15.0, 30.0]),
+        overload_inflight_thresholds=[
+            int(v) for v in _parse_numbers(os.getenv("OVERLOAD_INFLIGHT_THRESHOLDS", ""), [50, 100, 200, 400])
+        ],
+        overload_recover_seconds=float(os.getenv("OVERLOAD_RECOVER_SECONDS", "5")),
+        overload_lag_window_seconds=float(os.getenv("OVERLOAD_LAG_WINDOW", "5")),
+        helper_bot_tokens=[t.strip() for t in os.getenv("HELPER_BOT_TOKENS", "").split(",") if t.strip()],
+        helper_token_rate=float(os.getenv("HELPER_TOKEN_RATE", "20")),
+        catchup_threshold_seconds=float(os.getenv("CATCHUP_THRESHOLD", "60")),
+        restrict_after_deletes=int(os.getenv("RESTRICT_AFTER_DELETES", "0")),
+        restrict_window_seconds=float(os.getenv("RESTRICT_WINDOW", "60")),
+        # Telegram делает ограничение бессрочным, если until_date ближе 30 с или дальше 366 дней
+        # (нижняя граница с запасом, как MIN_MUTE_SECONDS в app.escalation)
+        restrict_max_seconds=min(max(int(os.getenv("RESTRICT_MAX_SECONDS", "86400")), 60), 366 * 86400 - 60),
+        webhook_host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+        webhook_port=int(os.getenv("WEBHOOK_PORT") or os.getenv("PORT") or "8080"),
+        webhook_path=os.getenv("WEBHOOK_PATH", "/webhook"),
+        webhook_secret=os.getenv("WEBHOOK_SECRET", "").strip(),
+        telegram_api_url=os.getenv("TELEGRAM_API_URL", "").strip(),
+        channel_meta_path=os.getenv("CHANNEL_META_PATH", os.path.join(DEFAULT_DATA_DIR, "channels_meta.json")),
+        capture_dir=os.getenv("CAPTURE_DIR", "").strip(),
+        capture_max_bytes=int(float(os.getenv("CAPTURE_MAX_MB", "64")) * 1024 * 1024),
+        capture_max_files=int(os.getenv("CAPTURE_FILES", "8")),
+        capture_salt=os.getenv("CAPTURE_SALT", ""),
+        runtime_mode=os.getenv("RUNTIME_MODE", "asyncio").strip().lower(),
+        ledger_per_user=int(os.getenv("LEDGER_PER_USER", "20")),
+        ledger_retro_seconds=int(os.getenv("LEDGER_RETRO_SECONDS", "60")),
     )
 
 
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import Dict, Tuple
+
+from aiogram import Bot
+from aiogram.types import ChatPermissions
+
+from .metrics import metrics
+
+
+logger = logging.getLogger("escalation")
+
+# Telegram считает ограничение бессрочным, если until_date ближе 30 секунд или дальше 366 дней;
+# нижняя граница с запасом на задержку сети и округление времени
+MIN_MUTE_SECONDS = 60
+MAX_MUTE_SECONDS = 366 * 86400
+
+# Порог размера таблицы счётчиков, после которого вычищаем истёкшие окна
+_STRIKES_PRUNE_AT = 10000
+
+_MUTED = ChatPermissions(
+    can_send_messages=False,
+    can_send_audios=False,
+    can_send_documents=False,
+    can_send_photos=False,
+    can_send_videos=False,
+    can_send_video_notes=False,
+    can_send_voice_notes=False,
+    can_send_polls=False,
+    can_send_other_messages=False,
+    can_add_web_page_previews=False,
+)
+# Все права True снимают с участника индивидуальные ограничения
+_UNMUTED = ChatPermissions(
+    can_send_messages=True,
+    can_send_audios=True,
+    can_send_documents=True,
+    can_send_photos=True,
+    can_send_videos=True,
+    can_send_video_notes=True,
+    can_send_voice_notes=True,
+    can_send_polls=True,
+    can_send_other_messages=True,
+    can_add_web_page_previews=True,
+    can_change_info=True,
+    can_invite_users=True,
+    can_pin_messages=True,
+    can_manage_topics=True,
+)
+
+
+def clamp_mute_seconds(value: int) -> int:
+    """Срок ограничения в пределах, которые Telegram не превращает в бессрочные."""
+    return min(max(int(value), MIN_MUTE_SECONDS), MAX_MUTE_SECONDS - 60)
+
+
+class EscalationPolicy:
+    """Временное ограничение неподписанных пользователей, которые продолжают писать.
+
+    Вместо удаления каждого сообщения: после `threshold` удалений
+    за `window_seconds` пользователь получает запрет на отправку
+    (restrictChatMember) максимум на `max_mute_seconds`. Запрет снимается,
+    как только событие chat_member показывает, что он подписался,
+    а по истечении срока запись о нём забывается и счёт удалений
+    начинается заново. Экономия API — грубая оценка по темпу удалений
+    до ограничения, не больше чем за одно окно `window_seconds`.
+
+    Состояние живёт только в памяти: после перезапуска бот не помнит
+    выданных ограничений, и досрочное снятие при подписке — по мере
+    возможности. Сам запрет в Telegram в любом случае истечёт по сроку.
+    """
+
+    def __init__(self, threshold: int, window_seconds: float = 60.0, max_mute_seconds: int = 86400) -> None:
+        self.threshold = max(1, int(threshold))
+        self.window_seconds = window_seconds
+        self.max_mute_seconds = clamp_mute_seconds(max_mute_seconds)
+        # (chat_id, user_id) → (начало окна, удалений в окне)
+        self._strikes: Dict[Tuple[int, int], Tuple[float, int]] = {}
+        # (chat_id, user_id) → (окончание ограничения по monotonic, удалений в секунду до него)
+        self._muted: Dict[Tuple[int, int], Tuple[float, float]] = {}
+        # Ближайшее окончание ограничения: до него просматривать таблицу незачем
+        self._next_expiry = float("inf")
+        metrics.set_gauge("escalation.muted", 0)
+
+    async def on_deleted(self, bot: Bot, chat_id: int, user_id: int) -> bool:
+        """Учесть удалённое сообщение. True, если пользователь только что ограничен."""
+        key = (chat_id, user_id)
+        now = time.monotonic()
+        if now >= self._next_expiry:
+            self._expire(now)
+        if key in self._muted:
+            return False
+        started, count = self._strikes.get(key, (now, 0))
+        if now - started > self.window_seconds:
+            started, count = now, 0
+        count += 1
+        if count <= self.threshold:
+            self._strikes[key] = (started, count)
+            if len(self._strikes) > _STRIKES_PRUNE_AT:
+                self._prune(now)
+            return False
+        self._strikes.pop(key, None)
+        try:
+            await bot.restrict_chat_member(
+                chat_id=chat_id,
+                user_id=user_id,
+                permissions=_MUTED,
+                until_date=int(time.time()) + self.max_mute_seconds,
+            )
+        except Exception:
+            logger.debug("restrict_chat_member failed for %s in %s", user_id, chat_id)
+            return False
+        rate = count / max(now - started, 1.0)
+        until = now + self.max_mute_seconds
+        self._muted[key] = (until, rate)
+        self._next_expiry = min(self._next_expiry, until)
+        metrics.inc("escalation.restrict_calls")
+        metrics.set_gauge("escalation.muted", len(self._muted))
+        logger.info("user %s muted in chat %s after %s deletions", user_id, chat_id, count)
+        return True
+
+    async def release(self, bot: Bot, user_id: int) -> None:
+        """Снять ограничения во всех чатах после подписки."""
+        now = time.monotonic()
+        for key in [k for k in self._muted if k[1] == user_id]:
+            chat_id = key[0]
+            until, rate = self._muted.pop(key)
+            if now >= until:
+                # Ограничение уже истекло само — снимать нечего
+                self._book_saved(0.0, rate, restrict_calls=1)
+                continue
+            try:
+                await bot.restrict_chat_member(chat_id=chat_id, user_id=user_id, permissions=_UNMUTED)
+            except Exception:
+                logger.debug("unrestrict failed for %s in %s", user_id, chat_id)
+            metrics.inc("escalation.restrict_calls")
+            saved = self._book_saved(until - now, rate, restrict_calls=2)
+            logger.info("user %s unmuted in chat %s, ~%s API calls saved", user_id, chat_id, saved)
+        metrics.set_gauge("escalation.muted", len(self._muted))
+
+    def _book_saved(self, remaining: float, rate: float, restrict_calls: int) -> int:
+        """Грубая оценка: удаления при прежнем темпе не дольше одного окна, минус вызовы restrict."""
+        duration = min(self.max_mute_seconds - max(remaining, 0.0), self.window_seconds)
+        saved = max(int(rate * max(duration, 0.0)) - restrict_calls, 0)
+        metrics.inc("escalation.calls_saved_rough", saved)
+        return saved
+
+    def _expire(self, now: float) -> None:
+        """Забыть истёкшие ограничения: Telegram снял их сам, счёт удалений начнётся заново."""
+        expired = [k for k, (until, _) in self._muted.items() if until <= now]
+        for key in expired:
+            _, rate = self._muted.pop(key)
+            self._book_saved(0.0, rate, restrict_calls=1)
+        self._next_expiry = min((until for until, _ in self._muted.values()), default=float("inf"))
+        metrics.set_gauge("escalation.muted", len(self._muted))
+
+    def _prune(self, now: float) -> None:
+        expired = [k for k, (started, _) in self._strikes.items() if now - started > self.window_seconds]
+        for key in expired:
+            del self._strikes[key]
+
+    def is_muted(self, chat_id: int, user_id: int) -> bool:
+        entry = self._muted.get((chat_id, user_id))
+        return entry is not None and entry[0] > time.monotonic()
@@ -2,8 +2,8 @@ from __future__ import annotations
 
 from aiogram import F, Router, Bot
 from aiogram.enums import ChatType
-from aiogram.types import Message, CallbackQuery, ChatMemberUpdated, ChatPermissions
-from aiogram.filters import ChatMemberUpdatedFilter, IS_MEMBER, IS_NOT_MEMBER
+from aiogram.types import Message, CallbackQuery, ChatMember, ChatMemberUpdated, InlineKeyboardMarkup, User
+from aiogram.dispatcher.event.bases import SkipHandler
 """Обработчики сообщений и событий для обязательной подписки.
 
 Удаляем сообщения нарушителей, отправляем напоминание с кнопками.
@@ -14,58 +14,202 @@ from aiogram.filters import ChatMemberUpdatedFilter, IS_MEMBER, IS_NOT_MEMBER
 from .config import Settings
 from .subscription import SubscriptionService
 from .keyboards import subscription_keyboard
-from .cache import TTLMemoryCache, TTLKVCache
-from .storage import ConfigStore
+from .cache import TTLMemoryCache, TTLKVCache, ScopedCache
+from .storage import ConfigStore, ChannelIndex
+from .audit import ParticipantRegistry
+from .catchup import CatchUpBatcher
+from .escalation import EscalationPolicy
+from .ledger import MessageLedger
+from .metrics import metrics
+from .overload import OverloadController, NO_GREETINGS, COLLAPSE_REMINDERS, DELETE_ONLY, CACHED_ONLY
 import logging
 import asyncio
 import html
 
 
 router = Router(name="mandatory-subscription")
-_notice_cache = TTLMemoryCache()
-_last_notice_message = TTLKVCache()
-_welcomed_cache = TTLMemoryCache()
+# Таблицы по chat_id с целым ключом user_id
+_notice_cache: ScopedCache[TTLMemoryCache] = ScopedCache(TTLMemoryCache)
+_last_notice_message: ScopedCache[TTLKVCache] = ScopedCache(TTLKVCache)
+_welcomed_cache: ScopedCache[TTLMemoryCache] = ScopedCache(TTLMemoryCache)
+# Свёрнутые напоминания при перегрузке: одно на чат, ключ — chat_id
+_chat_notice_cache = TTLMemoryCache()
+# Разрешённые ссылки на каналы по ID: (текст ссылки, URL)
+_channel_links = TTLKVCache()
+CHANNEL_LINK_TTL = 3600
 logger = logging.getLogger("handlers")
 
 
-def setup_handlers(settings: Settings, subs: SubscriptionService) -> Router:
-    store = ConfigStore(settings.config_store_path)
+def _is_target_chat(current_chat_id: int, target_chat_id: int | None) -> bool:
+    """Сопоставляет текущий чат с целевым, учитывая варианты ID супергруппы (-id и -100id)."""
+    if target_chat_id is None:
+        return True
+    if current_chat_id == target_chat_id:
+        return True
+    # Нормализуем к абсолютным строкам без знака
+    try:
+        abs_target = str(abs(int(target_chat_id)))
+        abs_current = str(abs(int(current_chat_id)))
+    except Exception:
+        return False
+    # В конфиге -id, фактически -100id
+    if not abs_target.startswith("100") and abs_current == ("100" + abs_target):
+        return True
+    # В конфиге -100id, фактически -id
+    if abs_target.startswith("100") and abs_target[3:] == abs_current:
+        return True
+    return False
+
+
+def _is_member(member: ChatMember) -> bool:
+    """Участник ли пользователь (те же правила, что у фильтра IS_MEMBER)."""
+    status = getattr(member, "status", None)
+    if status in {"creator", "administrator", "member"}:
+        return True
+    return status == "restricted" and bool(getattr(member, "is_member", False))
+
+
+async def _resolve_channel_link(bot: Bot, val: str) -> tuple[str, str | None]:
+    """Человекочитаемая ссылка и URL для канала, заданного числовым ID."""
+    try:
+        chat = await bot.get_chat(int(val))
+        if getattr(chat, "username", None):
+            return f"<a href=\"https://t.me/{chat.username}\">@{chat.username}</a>", f"https://t.me/{chat.username}"
+        # Для приватных каналов/чатов без username создаём инвайт‑ссылку (без t.me/c fallback)
+        title = getattr(chat, "title", None) or "канал"
+        chat_id = chat.id
+    except Exception:
+        # Если не удалось получить информацию — создаём/экспортируем инвайт; без t.me/c
+        title = None
+        chat_id = int(val)
+    invite_url = None
+    try:
+        invite = await bot.create_chat_invite_link(chat_id=chat_id)
+        invite_url = getattr(invite, "invite_link", None)
+    except Exception:
+        invite_url = None
+    if not invite_url:
+        try:
+            invite_url = await bot.export_chat_invite_link(chat_id=chat_id)
+        except Exception:
+            invite_url = None
+    label = html.escape(title) if title else "канал"
+    if invite_url:
+        return f"<a href=\"{invite_url}\">{label}</a>", invite_url
+    return label, None
+
+
+async def preload_channel_links(links: dict[str, tuple[str, str | None]]) -> None:
+    """Заполнить кэш ссылок заранее разрешёнными значениями (без вызовов API)."""
+    for val, link in links.items():
+        if link[1]:
+            await _channel_links.set(val, link, CHANNEL_LINK_TTL)
+
+
+async def render_reminder(bot: Bot, user: User, channels_values: list[str], resolve: bool = True) -> tuple[str, InlineKeyboardMarkup]:
+    """Текст напоминания и клавиатура со ссылками на обязательные каналы.
+
+    Ссылки на каналы с числовым ID кэшируются; при `resolve=False`
+    (перегрузка) в API не ходим и используем только кэш.
+    """
+    # Строим человекочитаемые упоминания и URL для кнопок
+    readable: list[str] = []
+    urls: list[str] = []
+    for val in channels_values:
+        if val.lstrip("-").isdigit():
+            link = await _channel_links.get(val)
+            if link is None and resolve:
+                link = await _resolve_channel_link(bot, val)
+                if link[1]:
+                    await _channel_links.set(val, link, CHANNEL_LINK_TTL)
+            label, url = link if link is not None else ("канал", None)
+            readable.append(label)
+            if url:
+                urls.append(url)
+        else:
+            username = val[1:] if val.startswith("@") else val
+            readable.append(f"<a href=\"https://t.me/{username}\">@{username}</a>")
+            urls.append(f"https://t.me/{username}")
+
+    # Упоминание пользователя, чтобы пришло уведомление
+    user_name = html.escape(getattr(user, "full_name", None) or getattr(user, "first_name", None) or "пользователь")
+    mention = f'<a href="tg://user?id={user.id}">{user_name}</a>'
+    text = (
+        f"{mention}, чтобы писать в чат, необходимо подписаться на канал(ы):\n"
+        + " | ".join(readable)
+    )
+    return text, subscription_keyboard(urls)
+
+
+def setup_handlers(
+    settings: Settings,
+    subs: SubscriptionService,
+    registry: ParticipantRegistry | None = None,
+    overload: OverloadController | None = None,
+    store: ConfigStore | None = None,
+    catchup: CatchUpBatcher | None = None,
+    escalation: EscalationPolicy | None = None,
+    ledger: MessageLedger | None = None,
+) -> Router:
+    # Общее с админкой хранилище: изменения каналов сразу видны обработчикам
+    if store is None:
+        store = ConfigStore(settings.config_store_path)
+    index_state: dict = {"version": None, "index": ChannelIndex(())}
+
+    async def _required_index() -> ChannelIndex:
+        """Индекс обязательных каналов; перестраивается только при изменении настроек."""
+        if index_state["version"] != store.version:
+            index_state["version"] = store.version
+            channels = await store.list_channels() or settings.required_channels
+            index_state["index"] = ChannelIndex(channels)
+        return index_state["index"]
+
+    def _degraded(stage: int) -> bool:
+        """True, если из-за перегрузки поведение ступени `stage` отключено."""
+        return overload is not None and not overload.allows(stage)
+
+    def _stale(date) -> bool:
+        """True для событий из бэклога после простоя (режим догоняния)."""
+        return catchup is not None and catchup.is_stale(date)
     
-    def _is_target_chat(current_chat_id: int, target_chat_id: int | None) -> bool:
-        """Сопоставляет текущий чат с целевым, учитывая варианты ID супергруппы (-id и -100id)."""
-        if target_chat_id is None:
-            return True
-        if current_chat_id == target_chat_id:
-            return True
-        # Нормализуем к абсолютным строкам без знака
+    def _remember(message: Message, allowed: bool) -> None:
+        if ledger is not None and message.from_user is not None:
+            ledger.record(message.chat.id, message.from_user.id, message.message_id, int(message.date.timestamp()), allowed)
+
+    async def _retro_cleanup(bot: Bot, chat_id: int, user_id: int, since: int) -> None:
+        """Удалить одним вызовом сообщения, пропущенные после момента `since`."""
+        if ledger is None:
+            return
+        message_ids = ledger.take_allowed(chat_id, user_id, since)
+        if not message_ids:
+            return
         try:
-            abs_target = str(abs(int(target_chat_id)))
-            abs_current = str(abs(int(current_chat_id)))
+            await bot.delete_messages(chat_id=chat_id, message_ids=message_ids)
         except Exception:
-            return False
-        # В конфиге -id, фактически -100id
-        if not abs_target.startswith("100") and abs_current == ("100" + abs_target):
-            return True
-        # В конфиге -100id, фактически -id
-        if abs_target.startswith("100") and abs_target[3:] == abs_current:
-            return True
-        return False
+            logger.debug("retro cleanup failed for user %s in chat %s", user_id, chat_id)
+            return
+        metrics.inc("ledger.retro_deleted", len(message_ids))
+        metrics.inc("messages.deleted", len(message_ids))
     
     async def _delete_message_later(bot: Bot, chat_id: int, message_id: int, delay_seconds: int = 20) -> None:
-        await asyncio.sleep(delay_seconds)
+        metrics.add_gauge("deletions.pending", 1)
         try:
-            await bot.delete_message(chat_id=chat_id, message_id=message_id)
-        except Exception:
-            pass
+            await asyncio.sleep(delay_seconds)
+            try:
+                await bot.delete_message(chat_id=chat_id, message_id=message_id)
+            except Exception:
+                pass
+        finally:
+            metrics.add_gauge("deletions.pending", -1)
     # Обрабатываем все сообщения и сверяемся с выбранным чатом динамически
     @router.message(F.chat.type.in_({ChatType.GROUP, ChatType.SUPERGROUP}))
     async def guard_message(message: Message) -> None:
         # Игнорируем собственные сообщения и сервисные
         if message.from_user is None or message.from_user.is_bot:
             return
-        # Игнорируем сервисные события (вступление/выход и т.п.) — для них есть отдельные хендлеры
+        # Сервисные события (вступление/выход и т.п.) отдаём следующим хендлерам
         if getattr(message, "new_chat_members", None) or getattr(message, "left_chat_member", None):
-            return
+            raise SkipHandler()
         target_chat_id = await store.get_chat_id()
         # Чат ещё не выбран через меню — не вмешиваемся
         if target_chat_id is None:
@@ -75,238 +219,96 @@ def setup_handlers(settings: Settings, subs: SubscriptionService) -> Router:
         if not _is_target_chat(message.chat.id, target_chat_id):
             return
         user_id = message.from_user.id
+        if registry is not None:
+            registry.add(user_id)
+        if _stale(message.date):
+            # Старое сообщение из бэклога: без приветствия и напоминания, проверка и удаление пачкой
+            await _welcomed_cache.table(message.chat.id).set_until(user_id, 604800)
+            catchup.submit(message)
+            return
         # Резервное приветствие на первый пользовательский месседж (если join-события скрыты)
-        welcome_key = f"welcomed:{message.chat.id}:{user_id}"
-        if not await _welcomed_cache.contains(welcome_key):
+        welcomed = _welcomed_cache.table(message.chat.id)
+        if _degraded(NO_GREETINGS):
+            # При перегрузке не приветствуем, но и не откладываем запоздалое приветствие
+            await welcomed.set_until(user_id, 604800)
+        elif not await welcomed.contains(user_id):
             user_name = html.escape(getattr(message.from_user, "full_name", None) or getattr(message.from_user, "first_name", None) or "участник")
             mention = f'<a href="tg://user?id={message.from_user.id}">{user_name}</a>'
             greet_text = mention + ": Привет 🦊\u202FДелай взаимку тут, и актив тебе обеспечен! Давай работать вместе! 🚀"
             try:
                 sent_greet = await message.answer(greet_text)
+                metrics.inc("greetings.sent")
                 asyncio.create_task(_delete_message_later(message.bot, message.chat.id, sent_greet.message_id, 20))
-                await _welcomed_cache.set_until(welcome_key, 604800)  # 7 дней
+                await welcomed.set_until(user_id, 604800)  # 7 дней
                 logger.info("guard_message: fallback greeting sent to user %s in chat %s", user_id, message.chat.id)
             except Exception:
                 pass
-        if await subs.is_fully_subscribed(user_id):
+        # На ступени CACHED_ONLY промах кэша — «не подписан» без проверки через API
+        unconfirmed = _degraded(CACHED_ONLY)
+        if await subs.is_fully_subscribed(user_id, cached_only=unconfirmed):
             logger.debug("guard_message: user %s is subscribed", user_id)
             # Пользователь подписан — пробуем удалить прошлое напоминание, если оно было
-            key = f"notice:{message.chat.id}:{user_id}"
-            msg_id = await _last_notice_message.get(key)
+            last_notices = _last_notice_message.table(message.chat.id)
+            msg_id = await last_notices.get(user_id)
             if msg_id:
                 try:
                     await message.bot.delete_message(chat_id=message.chat.id, message_id=msg_id)
                 except Exception:
                     pass
-                await _last_notice_message.delete(key)
+                await last_notices.delete(user_id)
+            _remember(message, True)
             return
+        # Сообщения, пропущенные по устаревшему вердикту, удаляем вместе с текущим одним вызовом
+        retro: list[int] = []
+        if ledger is not None and settings.ledger_retro_seconds > 0 and not unconfirmed:
+            retro = ledger.take_allowed(message.chat.id, user_id, int(message.date.timestamp()) - settings.ledger_retro_seconds)
+        _remember(message, False)
         try:
-            await message.delete()
+            if retro:
+                await message.bot.delete_messages(chat_id=message.chat.id, message_ids=retro + [message.message_id])
+                metrics.inc("ledger.retro_deleted", len(retro))
+                metrics.inc("messages.deleted", len(retro) + 1)
+            else:
+                await message.delete()
+                metrics.inc("messages.deleted")
         except Exception:
             # Если не хватает прав — всё равно отправим напоминание
             pass
+        else:
+            # Повторный нарушитель получает временный запрет вместо удаления каждого сообщения
+            # (только по вердикту из API: промах кэша при перегрузке не повод ограничивать)
+            if escalation is not None and not unconfirmed and await escalation.on_deleted(message.bot, message.chat.id, user_id):
+                return
+        if _degraded(DELETE_ONLY):
+            return
 
         # Антиспам на напоминание для одного пользователя в рамках чата
-        key = f"notice:{message.chat.id}:{user_id}"
-        if await _notice_cache.contains(key):
+        notices = _notice_cache.table(message.chat.id)
+        if await notices.contains(user_id):
+            return
+        # При перегрузке — одно напоминание на весь чат за период антиспама
+        collapse = _degraded(COLLAPSE_REMINDERS)
+        if collapse and await _chat_notice_cache.contains(message.chat.id):
             return
 
         channels_values = await store.list_channels() or settings.required_channels
-        # Строим человекочитаемые упоминания и URL для кнопок
-        readable: list[str] = []
-        urls: list[str] = []
-        for val in channels_values:
-            if val.lstrip("-").isdigit():
-                try:
-                    chat = await message.bot.get_chat(int(val))
-                    if getattr(chat, "username", None):
-                        readable.append(f"<a href=\"https://t.me/{chat.username}\">@{chat.username}</a>")
-                        urls.append(f"https://t.me/{chat.username}")
-                    else:
-                        # Для приватных каналов/чатов без username создаём инвайт‑ссылку (без t.me/c fallback)
-                        title = getattr(chat, "title", None) or "канал"
-                        invite_url = None
-                        try:
-                            invite = await message.bot.create_chat_invite_link(chat_id=chat.id)
-                            invite_url = getattr(invite, "invite_link", None)
-                        except Exception:
-                            invite_url = None
-                        if not invite_url:
-                            try:
-                                export_url = await message.bot.export_chat_invite_link(chat_id=chat.id)
-                            except Exception:
-                                export_url = None
-                            invite_url = export_url
-                        if invite_url:
-                            readable.append(f"<a href=\"{invite_url}\">{html.escape(title)}</a>")
-                            urls.append(invite_url)
-                        else:
-                            readable.append(html.escape(title))
-                except Exception:
-                    # Если не удалось получить информацию — создаём/экспортируем инвайт; без t.me/c
-                    invite_url = None
-                    try:
-                        invite = await message.bot.create_chat_invite_link(chat_id=int(val))
-                        invite_url = getattr(invite, "invite_link", None)
-                    except Exception:
-                        invite_url = None
-                    if not invite_url:
-                        try:
-                            export_url = await message.bot.export_chat_invite_link(chat_id=int(val))
-                        except Exception:
-                            export_url = None
-                        invite_url = export_url
-                    if invite_url:
-                        readable.append(f"<a href=\"{invite_url}\">канал</a>")
-                        urls.append(invite_url)
-                    else:
-                        readable.append("канал")
-            else:
-                username = val[1:] if val.startswith("@") else val
-                readable.append(f"<a href=\"https://t.me/{username}\">@{username}</a>")
-                urls.append(f"https://t.me/{username}")
-
-        # Упоминание пользователя, чтобы пришло уведомление
-        user_name = html.escape(getattr(message.from_user, "full_name", None) or getattr(message.from_user, "first_name", None) or "пользователь")
-        mention = f'<a href="tg://user?id={message.from_user.id}">{user_name}</a>'
-        text = (
-            f"{mention}, чтобы писать в чат, необходимо подписаться на канал(ы):\n"
-            + " | ".join(readable)
-        )
+        text, markup = await render_reminder(message.bot, message.from_user, channels_values, resolve=not collapse)
         # Отправляем напоминание
         reminder = await message.answer(
             text=text,
-            reply_markup=subscription_keyboard(urls),
+            reply_markup=markup,
             disable_web_page_preview=True,
         )
-        await _notice_cache.set_until(key, settings.notify_ttl_seconds)
+        metrics.inc("reminders.sent")
+        await notices.set_until(user_id, settings.notify_ttl_seconds)
+        if collapse:
+            await _chat_notice_cache.set_until(message.chat.id, settings.notify_ttl_seconds)
         # Запоминаем id напоминания, чтобы удалить при повторной подписке (храним 1 час)
-        await _last_notice_message.set(key, reminder.message_id, 3600)
+        await _last_notice_message.table(message.chat.id).set(user_id, reminder.message_id, 3600)
         logger.info("notice sent to user %s in chat %s", user_id, message.chat.id)
         # Автоудаление напоминания через ~20 секунд
         asyncio.create_task(_delete_message_later(message.bot, message.chat.id, reminder.message_id, 20))
 
-    # Мгновенно ограничиваем отправку сообщений при выходе из обязательного канала
-    @router.chat_member(ChatMemberUpdatedFilter(IS_MEMBER >> IS_NOT_MEMBER))
-    async def on_leave_required_channel(event: ChatMemberUpdated, bot: Bot) -> None:
-        chat = event.chat
-        # Каналы сверяем динамически из хранилища
-        channels = await store.list_channels() or settings.required_channels
-        required_usernames = {c.lower() for c in channels if not c.lstrip("-").isdigit()}
-        required_ids = {int(c) for c in channels if c.lstrip("-").isdigit()}
-        username = ("@" + chat.username.lower()) if getattr(chat, "username", None) else None
-        if (username and username in required_usernames) or (chat.id in required_ids):
-            user_id = event.new_chat_member.user.id
-            # Больше не ограничиваем отправку сообщений — будем удалять сообщения и напоминать
-
-            # Отправляем напоминание в целевой чат с антиспамом и кнопками
-            try:
-                target_chat_id = await store.get_chat_id()
-                if target_chat_id is None:
-                    return
-                key = f"notice:{target_chat_id}:{user_id}"
-                if await _notice_cache.contains(key):
-                    return
-
-                channels_values = await store.list_channels() or settings.required_channels
-                readable: list[str] = []
-                urls: list[str] = []
-                for val in channels_values:
-                    if val.lstrip("-").isdigit():
-                        try:
-                            ch = await bot.get_chat(int(val))
-                            if getattr(ch, "username", None):
-                                readable.append(f"<a href=\"https://t.me/{ch.username}\">@{ch.username}</a>")
-                                urls.append(f"https://t.me/{ch.username}")
-                            else:
-                                title = getattr(ch, "title", None) or "канал"
-                                invite_url = None
-                                try:
-                                    invite = await bot.create_chat_invite_link(chat_id=ch.id)
-                                    invite_url = getattr(invite, "invite_link", None)
-                                except Exception:
-                                    invite_url = None
-                                if not invite_url:
-                                    try:
-                                        export_url = await bot.export_chat_invite_link(chat_id=ch.id)
-                                    except Exception:
-                                        export_url = None
-                                    invite_url = export_url
-                                if invite_url:
-                                    readable.append(f"<a href=\"{invite_url}\">{html.escape(title)}</a>")
-                                    urls.append(invite_url)
-                                else:
-                                    readable.append(html.escape(title))
-                        except Exception:
-                            invite_url = None
-                            try:
-                                invite = await bot.create_chat_invite_link(chat_id=int(val))
-                                invite_url = getattr(invite, "invite_link", None)
-                            except Exception:
-                                invite_url = None
-                            if not invite_url:
-                                try:
-                                    export_url = await bot.export_chat_invite_link(chat_id=int(val))
-                                except Exception:
-                                    export_url = None
-                                invite_url = export_url
-                            if invite_url:
-                                readable.append(f"<a href=\"{invite_url}\">канал</a>")
-                                urls.append(invite_url)
-                            else:
-                                readable.append("канал")
-                    else:
-                        un = val[1:] if val.startswith("@") else val
-                        readable.append(f"<a href=\"https://t.me/{un}\">@{un}</a>")
-                        urls.append(f"https://t.me/{un}")
-
-                user = event.new_chat_member.user
-                user_name = html.escape(getattr(user, "full_name", None) or getattr(user, "first_name", None) or "пользователь")
-                mention = f'<a href="tg://user?id={user.id}">{user_name}</a>'
-                text = (
-                    f"{mention}, чтобы писать в чат, необходимо подписаться на канал(ы):\n"
-                    + " | ".join(readable)
-                )
-                reminder = await bot.send_message(
-                    chat_id=target_chat_id,
-                    text=text,
-                    reply_markup=subscription_keyboard(urls),
-                    disable_web_page_preview=True,
-                )
-                await _notice_cache.set_until(key, settings.notify_ttl_seconds)
-                await _last_notice_message.set(key, reminder.message_id, 3600)
-                logger.info("notice sent (leave event) to user %s in chat %s", user_id, target_chat_id)
-                # Автоудаление напоминания через ~20 секунд
-                asyncio.create_task(_delete_message_later(bot, target_chat_id, reminder.message_id, 20))
-            except Exception:
-                # Не блокируем основной поток при ошибке отправки напоминания
-                pass
-
-    # Снимаем ограничение и удаляем напоминание при повторной подписке
-    @router.chat_member(ChatMemberUpdatedFilter(IS_NOT_MEMBER >> IS_MEMBER))
-    async def on_join_required_channel(event: ChatMemberUpdated, bot: Bot) -> None:
-        chat = event.chat
-        channels = await store.list_channels() or settings.required_channels
-        required_usernames = {c.lower() for c in channels if not c.lstrip("-").isdigit()}
-        required_ids = {int(c) for c in channels if c.lstrip("-").isdigit()}
-        username = ("@" + chat.username.lower()) if getattr(chat, "username", None) else None
-        if (username and username in required_usernames) or (chat.id in required_ids):
-            user_id = event.new_chat_member.user.id
-            if await subs.is_fully_subscribed(user_id):
-                # Снятие ограничений не требуется, так как мы их не накладываем
-                # Try to delete last reminder in the chat to keep it clean
-                target_chat_id = await store.get_chat_id()
-                if target_chat_id is None:
-                    return
-                key = f"notice:{target_chat_id}:{user_id}"
-                msg_id = await _last_notice_message.get(key)
-                if msg_id:
-                    try:
-                        await bot.delete_message(chat_id=target_chat_id, message_id=msg_id)
-                    except Exception:
-                        pass
-                    await _last_notice_message.delete(key)
-
     # Кнопки «Проверить подписку» нет — автоочистка работает по событию и при первом корректном сообщении
 
     # Приветствие новых участников целевого чата
@@ -316,7 +318,7 @@ def setup_handlers(settings: Settings, subs: SubscriptionService) -> Router:
         # Если целевой чат назначен — приветствуем только там; иначе — во всех группах
         if target_chat_id is not None and not _is_target_chat(message.chat.id, target_chat_id):
             return
-        logger.info("welcome_new_members: trigger in chat %s, target=%s", message.chat.id, target_chat_id)
+        logger.debug("welcome_new_members: trigger in chat %s, target=%s", message.chat.id, target_chat_id)
         members = message.new_chat_members or []
         mentions: list[str] = []
         for m in members:
@@ -327,49 +329,141 @@ def setup_handlers(settings: Settings, subs: SubscriptionService) -> Router:
             mentions.append(f'<a href="tg://user?id={m.id}">{user_name}</a>')
         if not mentions:
             return
-        text = ", ".join(mentions) + ": Привет 🦊\u202FДелай взаимку тут, и актив тебе обеспечен! Давай работать вместе! 🚀"
-        try:
-            sent = await message.answer(text)
-            # Автоудаление приветствия через ~20 секунд
-            asyncio.create_task(_delete_message_later(message.bot, message.chat.id, sent.message_id, 20))
-            logger.info("welcome_new_members: sent greeting to %s in chat %s", mentions, message.chat.id)
-        except Exception:
-            pass
+        # При перегрузке и для устаревших событий приветствия пропускаем, но участников всё равно помечаем
+        if not _degraded(NO_GREETINGS) and not _stale(message.date):
+            text = ", ".join(mentions) + ": Привет 🦊\u202FДелай взаимку тут, и актив тебе обеспечен! Давай работать вместе! 🚀"
+            try:
+                sent = await message.answer(text)
+                metrics.inc("greetings.sent")
+                # Автоудаление приветствия через ~20 секунд
+                asyncio.create_task(_delete_message_later(message.bot, message.chat.id, sent.message_id, 20))
+                logger.info("welcome_new_members: sent greeting to %s in chat %s", mentions, message.chat.id)
+            except Exception:
+                pass
         # Помечаем пользователей как уже поприветствованных
         for m in members:
+            if registry is not None and not getattr(m, "is_bot", False):
+                registry.add(m.id)
             try:
-                await _welcomed_cache.set_until(f"welcomed:{message.chat.id}:{m.id}", 604800)
+                await _welcomed_cache.table(message.chat.id).set_until(m.id, 604800)
             except Exception:
                 pass
 
-    # Резервное приветствие по событию изменения статуса участника (если сервисное сообщение не пришло)
-    @router.chat_member(ChatMemberUpdatedFilter(IS_NOT_MEMBER >> IS_MEMBER))
-    async def welcome_on_chat_member(event: ChatMemberUpdated, bot: Bot) -> None:
-        chat = event.chat
-        if getattr(chat, "type", None) not in {ChatType.GROUP, ChatType.SUPERGROUP}:
-            return
-        target_chat_id = await store.get_chat_id()
-        if target_chat_id is not None and not _is_target_chat(chat.id, target_chat_id):
+    async def _on_leave_required_channel(event: ChatMemberUpdated, bot: Bot) -> None:
+        """Выход из обязательного канала: напоминание в целевом чате."""
+        user_id = event.new_chat_member.user.id
+        # По умолчанию не ограничиваем отправку сообщений — удаляем и напоминаем (см. EscalationPolicy)
+        if _degraded(DELETE_ONLY):
             return
-        logger.info("welcome_on_chat_member: trigger in chat %s, target=%s", chat.id, target_chat_id)
-        user = event.new_chat_member.user
-        if getattr(user, "is_bot", False):
-            return
-        user_name = html.escape(getattr(user, "full_name", None) or getattr(user, "first_name", None) or "участник")
-        mention = f'<a href="tg://user?id={user.id}">{user_name}</a>'
-        text = mention + ": Привет 🦊\u202FДелай взаимку тут, и актив тебе обеспечен! Давай работать вместе! 🚀"
+        # Отправляем напоминание в целевой чат с антиспамом и кнопками
         try:
-            sent = await bot.send_message(chat_id=chat.id, text=text)
-            asyncio.create_task(_delete_message_later(bot, chat.id, sent.message_id, 20))
-            logger.info("welcome_on_chat_member: sent greeting to user %s in chat %s", user.id, chat.id)
+            target_chat_id = await store.get_chat_id()
+            if target_chat_id is None:
+                return
+            notices = _notice_cache.table(target_chat_id)
+            if await notices.contains(user_id):
+                return
+            collapse = _degraded(COLLAPSE_REMINDERS)
+            if collapse and await _chat_notice_cache.contains(target_chat_id):
+                return
+
+            channels_values = await store.list_channels() or settings.required_channels
+            text, markup = await render_reminder(bot, event.new_chat_member.user, channels_values, resolve=not collapse)
+            reminder = await bot.send_message(
+                chat_id=target_chat_id,
+                text=text,
+                reply_markup=markup,
+                disable_web_page_preview=True,
+            )
+            metrics.inc("reminders.sent")
+            await notices.set_until(user_id, settings.notify_ttl_seconds)
+            if collapse:
+                await _chat_notice_cache.set_until(target_chat_id, settings.notify_ttl_seconds)
+            await _last_notice_message.table(target_chat_id).set(user_id, reminder.message_id, 3600)
+            logger.info("notice sent (leave event) to user %s in chat %s", user_id, target_chat_id)
+            # Автоудаление напоминания через ~20 секунд
+            asyncio.create_task(_delete_message_later(bot, target_chat_id, reminder.message_id, 20))
         except Exception:
+            # Не блокируем основной поток при ошибке отправки напоминания
             pass
+
+    async def _on_join_required_channel(event: ChatMemberUpdated, bot: Bot) -> None:
+        """Подписка на обязательный канал: удаляем прошлое напоминание."""
+        user_id = event.new_chat_member.user.id
+        if await subs.is_fully_subscribed(user_id):
+            # Снимаем временный запрет, если он был наложен политикой эскалации
+            if escalation is not None:
+                await escalation.release(bot, user_id)
+            # Try to delete last reminder in the chat to keep it clean
+            target_chat_id = await store.get_chat_id()
+            if target_chat_id is None:
+                return
+            last_notices = _last_notice_message.table(target_chat_id)
+            msg_id = await last_notices.get(user_id)
+            if msg_id:
+                try:
+                    await bot.delete_message(chat_id=target_chat_id, message_id=msg_id)
+                except Exception:
+                    pass
+                await last_notices.delete(user_id)
+
+    async def _welcome_on_chat_member(event: ChatMemberUpdated, bot: Bot, stale: bool) -> None:
+        """Резервное приветствие по событию вступления (если сервисное сообщение не пришло)."""
+        chat = event.chat
+        user = event.new_chat_member.user
+        logger.debug("welcome_on_chat_member: trigger in chat %s", chat.id)
+        if getattr(user, "is_bot", False):
+            return
+        if registry is not None:
+            registry.add(user.id)
+        if not _degraded(NO_GREETINGS) and not stale:
+            user_name = html.escape(getattr(user, "full_name", None) or getattr(user, "first_name", None) or "участник")
+            mention = f'<a href="tg://user?id={user.id}">{user_name}</a>'
+            text = mention + ": Привет 🦊\u202FДелай взаимку тут, и актив тебе обеспечен! Давай работать вместе! 🚀"
+            try:
+                sent = await bot.send_message(chat_id=chat.id, text=text)
+                metrics.inc("greetings.sent")
+                asyncio.create_task(_delete_message_later(bot, chat.id, sent.message_id, 20))
+                logger.info("welcome_on_chat_member: sent greeting to user %s in chat %s", user.id, chat.id)
+            except Exception:
+                pass
         # Помечаем как поприветствованного
         try:
-            await _welcomed_cache.set_until(f"welcomed:{chat.id}:{user.id}", 604800)
+            await _welcomed_cache.table(chat.id).set_until(user.id, 604800)
         except Exception:
             pass
 
+    # Единая точка входа для chat_member: событие классифицируется один раз
+    # и раздаётся логике вступления/выхода и приветствия. Раньше несколько
+    # хендлеров с одинаковым фильтром перехватывали события друг у друга.
+    @router.chat_member()
+    async def on_chat_member(event: ChatMemberUpdated, bot: Bot) -> None:
+        was_member = _is_member(event.old_chat_member)
+        is_member = _is_member(event.new_chat_member)
+        if was_member == is_member:
+            return
+        chat = event.chat
+        # Напоминания и приветствия по событиям из бэклога уже неактуальны
+        stale = _stale(event.date)
+        index = await _required_index()
+        if index.matches(chat.id, getattr(chat, "username", None)):
+            if is_member:
+                await _on_join_required_channel(event, bot)
+            else:
+                # Вердикт и стаж подписки сбрасываются даже для событий из бэклога
+                user_id = event.new_chat_member.user.id
+                await subs.invalidate(user_id)
+                # Сообщения, пропущенные после выхода (по ещё не сброшенному вердикту)
+                target_chat_id = await store.get_chat_id()
+                if target_chat_id is not None:
+                    await _retro_cleanup(bot, target_chat_id, user_id, int(event.date.timestamp()))
+                if not stale:
+                    await _on_leave_required_channel(event, bot)
+        if is_member and getattr(chat, "type", None) in {ChatType.GROUP, ChatType.SUPERGROUP}:
+            target_chat_id = await store.get_chat_id()
+            if target_chat_id is None or _is_target_chat(chat.id, target_chat_id):
+                await _welcome_on_chat_member(event, bot, stale)
+
     # Удаляем также отредактированные сообщения от неподписанных пользователей
     @router.edited_message(F.chat.type.in_({ChatType.GROUP, ChatType.SUPERGROUP}))
     async def guard_edited_message(message: Message) -> None:
@@ -381,12 +475,31 @@ def setup_handlers(settings: Settings, subs: SubscriptionService) -> Router:
         if not _is_target_chat(message.chat.id, target_chat_id):
             return
         user_id = message.from_user.id
+        decision = ledger.decision(message.chat.id, user_id, message.message_id) if ledger is not None else None
+        # Исходное сообщение уже удалено: ни проверки, ни повторного удаления.
+        # Пропущенное же проверяем заново — пользователь мог с тех пор отписаться
+        # (свежий вердикт всё равно возьмётся из кэша без вызова API)
+        if decision is False:
+            metrics.inc("ledger.edit_answered")
+            return
+
+        def remember_edit(allowed: bool) -> None:
+            if decision is None:
+                _remember(message, allowed)
+            elif ledger is not None:
+                ledger.update(message.chat.id, user_id, message.message_id, allowed)
+
         if await subs.is_fully_subscribed(user_id):
+            remember_edit(True)
             return
+        remember_edit(False)
         try:
             await message.delete()
+            metrics.inc("messages.deleted")
         except Exception:
-            pass
+            return
+        if escalation is not None:
+            await escalation.on_deleted(message.bot, message.chat.id, user_id)
 
     return router
 
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+# Ограничение Bot API на один вызов deleteMessages (одно место — под текущее сообщение)
+MAX_PER_USER = 99
+
+# (message_id, дата сообщения в unix time, пропущено ли)
+Entry = Tuple[int, int, bool]
+
+
+class MessageLedger:
+    """Журнал решений по недавним сообщениям: чат → пользователь → кольцо записей.
+
+    Для каждого пользователя хранится не больше `per_user` последних
+    сообщений и решение по каждому (пропущено или удалено), для чата —
+    не больше `max_users` недавно писавших пользователей: давно молчащие
+    вытесняются первыми. По журналу отвечаем на правки без вызовов API
+    и находим сообщения, пропущенные по устаревшему вердикту.
+    """
+
+    __slots__ = ("per_user", "max_users", "_chats")
+
+    def __init__(self, per_user: int = 20, max_users: int = 10000) -> None:
+        self.per_user = max(1, min(int(per_user), MAX_PER_USER))
+        self.max_users = max(1, int(max_users))
+        self._chats: Dict[int, "OrderedDict[int, Deque[Entry]]"] = {}
+
+    def __len__(self) -> int:
+        return sum(len(users) for users in self._chats.values())
+
+    def record(self, chat_id: int, user_id: int, message_id: int, date: int, allowed: bool) -> None:
+        users = self._chats.get(chat_id)
+        if users is None:
+            users = self._chats[chat_id] = OrderedDict()
+        entries = users.get(user_id)
+        if entries is None:
+            if len(users) >= self.max_users:
+                users.popitem(last=False)
+            entries = users[user_id] = deque(maxlen=self.per_user)
+        else:
+            users.move_to_end(user_id)
+        entries.append((message_id, date, allowed))
+
+    def decision(self, chat_id: int, user_id: int, message_id: int) -> Optional[bool]:
+        """Решение по сообщению или None, если его уже нет в журнале."""
+        users = self._chats.get(chat_id)
+        entries = users.get(user_id) if users is not None else None
+        if not entries:
+            return None
+        for mid, _, allowed in reversed(entries):
+            if mid == message_id:
+                return allowed
+        return None
+
+    def update(self, chat_id: int, user_id: int, message_id: int, allowed: bool) -> bool:
+        """Заменить решение по сообщению, не добавляя записи. False — сообщения нет в журнале."""
+        users = self._chats.get(chat_id)
+        entries = users.get(user_id) if users is not None else None
+        if not entries:
+            return False
+        for idx in range(len(entries) - 1, -1, -1):
+            mid, date, _ = entries[idx]
+            if mid == message_id:
+                entries[idx] = (mid, date, allowed)
+                return True
+        return False
+
+    def take_allowed(self, chat_id: int, user_id: int, since: int) -> List[int]:
+        """ID пропущенных сообщений не раньше `since`; в журнале они помечаются удалёнными."""
+        users = self._chats.get(chat_id)
+        entries = users.get(user_id) if users is not None else None
+        if not entries:
+            return []
+        taken = [mid for mid, date, allowed in entries if allowed and date >= since]
+        if taken:
+            marked = [(mid, date, allowed and date < since) for mid, date, allowed in entries]
+            entries.clear()
+            entries.extend(marked)
+        return taken
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, IO, Optional, Tuple
+
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+# Защита от неограниченного роста, если кто-то логирует f-строками
+_MAX_KEYS = 1000
+
+
+class RateLimitFilter(logging.Filter):
+    """Ограничение частоты одинаковых записей с выборкой и сводкой.
+
+    Тип события — пара (логгер, шаблон сообщения). За `window_seconds`
+    пропускается не больше `burst` записей одного типа, дальше — только
+    каждая `sample_every`-я (0 — ни одной). Первая пропущенная запись
+    после подавления получает приписку «N similar suppressed».
+    WARNING и выше не ограничиваются.
+    """
+
+    def __init__(self, burst: int = 20, window_seconds: float = 10.0, sample_every: int = 100) -> None:
+        super().__init__()
+        self.burst = max(1, int(burst))
+        self.window_seconds = window_seconds
+        self.sample_every = max(0, int(sample_every))
+        # тип события → [начало окна, записей в окне, подавлено подряд]
+        self._state: Dict[Tuple[str, object], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        state = self._state.get(key)
+        if state is None:
+            if len(self._state) >= _MAX_KEYS:
+                self._state.clear()
+            state = self._state[key] = [now, 0, 0]
+        elif now - state[0] >= self.window_seconds:
+            state[0], state[1] = now, 0
+        state[1] += 1
+        if state[1] > self.burst and not (self.sample_every and state[1] % self.sample_every == 0):
+            state[2] += 1
+            return False
+        if state[2]:
+            record.msg = f"{record.msg} ({state[2]} similar suppressed)"
+            state[2] = 0
+        return True
+
+
+def setup_logging(level: Optional[str] = None, stream: Optional[IO[str]] = None) -> QueueListener:
+    """Логирование без блокирующей записи в event loop.
+
+    Обработчики корневого логгера заменяются одним `QueueHandler`:
+    в потоке event loop остаются только фильтр частоты и постановка
+    в очередь, а форматирование и запись в `stream` (по умолчанию stderr)
+    выполняет фоновый поток `QueueListener`. Параметры фильтра —
+    LOG_BURST, LOG_WINDOW и LOG_SAMPLE_EVERY.
+    """
+    level_name = (level or os.getenv("LOG_LEVEL") or "INFO").upper()
+    target = logging.StreamHandler(stream)
+    target.setFormatter(logging.Formatter(LOG_FORMAT))
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = QueueHandler(records)
+    handler.addFilter(
+        RateLimitFilter(
+            burst=int(os.getenv("LOG_BURST", "20")),
+            window_seconds=float(os.getenv("LOG_WINDOW", "10")),
+            sample_every=int(os.getenv("LOG_SAMPLE_EVERY", "100")),
+        )
+    )
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(getattr(logging, level_name, logging.INFO))
+    listener = QueueListener(records, target)
+    listener.start()
+    # Дописываем хвост очереди при выходе
+    atexit.register(stop_logging, listener)
+    return listener
+
+
+def stop_logging(listener: QueueListener) -> None:
+    """Остановить фоновый поток, дописав очередь (повторный вызов безопасен)."""
+    if listener._thread is not None:
+        listener.stop()
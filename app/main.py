@@ -1,64 +1,210 @@
 import asyncio
+import os
+from dataclasses import dataclass
+from typing import List, Optional
 
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 import logging
 
-from .config import load_settings
-from .handlers import setup_handlers
+from .config import Settings, load_settings
+from .handlers import preload_channel_links, setup_handlers
 from .subscription import SubscriptionService
-from .storage import ConfigStore
+from .storage import ConfigStore, load_channel_meta
 from .admin import setup_admin
+from .session import TunedAiohttpSession, CircuitBreaker
+from .audit import ParticipantRegistry, SubscriptionAudit
+from .overload import OverloadController, OverloadMiddleware
+from .token_pool import BotTokenPool
+from .catchup import CatchUpBatcher
+from .escalation import EscalationPolicy
+from .ledger import MessageLedger
+from .stats import HandlerStatsMiddleware
+from .capture import CaptureMiddleware, CaptureWriter
+from .logs import setup_logging
+from . import runtime
 
 
-async def main() -> None:
-    """Точка входа: создаём бота/диспетчер и запускаем поллинг."""
-    logging.basicConfig(
-        level=getattr(logging, (__import__('os').getenv('LOG_LEVEL') or 'INFO').upper(), logging.INFO),
-        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
-    )
+@dataclass
+class Application:
+    """Собранные бот и диспетчер вместе с тем, что нужно закрыть при остановке."""
+
+    bot: Bot
+    dispatcher: Dispatcher
+    store: ConfigStore
+    registry: ParticipantRegistry
+    capture: Optional[CaptureWriter] = None
+
+    def background_tasks(self) -> List[asyncio.Task]:
+        """Фоновые сбросы на диск: участники и, если включена, запись апдейтов."""
+        tasks = [asyncio.create_task(self.registry.run_flusher())]
+        if self.capture is not None:
+            tasks.append(asyncio.create_task(self.capture.run_flusher()))
+        return tasks
+
+    async def close(self) -> None:
+        self.registry.flush()
+        if self.capture is not None:
+            await self.capture.flush()
+        # Дожидаемся фоновой записи настроек, чтобы не потерять последние изменения
+        try:
+            await self.store.close()
+        except OSError:
+            logging.getLogger("app").error(
+                "config store %s was not saved on shutdown, recent admin changes are lost", self.store.path
+            )
+
+
+def build_application(settings: Settings, session: Optional[BaseSession] = None) -> Application:
+    """Собрать бота, сервисы и роутеры. Сетевых вызовов здесь нет.
+
+    `session` подменяет HTTP-сессию (например, заглушкой при воспроизведении записи).
+    """
     logger = logging.getLogger("app")
-    settings = load_settings()
-    bot = Bot(token=settings.bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    if session is None:
+        session = TunedAiohttpSession(
+            pool_size=settings.http_pool_size,
+            keepalive_seconds=settings.http_keepalive_seconds,
+            dns_ttl_seconds=settings.http_dns_ttl_seconds,
+            method_timeouts=settings.http_method_timeouts,
+            api_url=settings.telegram_api_url,
+            timeout=settings.http_timeout_seconds,
+        )
+    bot = Bot(token=settings.bot_token, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
     dp = Dispatcher()
+    capture = None
+    if settings.capture_dir:
+        # Регистрируется первой, чтобы записывать апдейты до любой деградации
+        capture = CaptureWriter(
+            settings.capture_dir,
+            max_bytes=settings.capture_max_bytes,
+            max_files=settings.capture_max_files,
+            salt=settings.capture_salt,
+        )
+        dp.update.outer_middleware(CaptureMiddleware(capture))
+        logger.info("Capturing updates into %s", settings.capture_dir)
 
     store = ConfigStore(settings.config_store_path)
-
-    # Нормализуем ранее сохранённые каналы: заменяем числовые ID на @username, если доступно
-    async def _normalize_channels_usernames() -> None:
-        channels = await store.list_channels()
-        changed = False
-        for val in channels:
-            if val.lstrip("-").isdigit():
-                try:
-                    chat = await bot.get_chat(int(val))
-                    if getattr(chat, "username", None):
-                        await store.remove_channel(val)
-                        await store.add_channel(f"@{chat.username}")
-                        changed = True
-                except Exception:
-                    pass
-        if changed:
-            logger.info("Normalized channels to @usernames where available")
-
-    await _normalize_channels_usernames()
-    subs = SubscriptionService(bot=bot, channels=settings.required_channels, ttl_seconds=settings.cache_ttl_seconds, store=store)
-    router = setup_handlers(settings, subs)
+    breaker = CircuitBreaker(
+        "get_chat_member",
+        failure_threshold=settings.breaker_failure_threshold,
+        reset_seconds=settings.breaker_reset_seconds,
+        session=session if isinstance(session, TunedAiohttpSession) else None,
+    )
+    pool = None
+    if settings.helper_bot_tokens:
+        # Вспомогательные боты делят HTTP-пул с основным
+        helpers = [Bot(token=t, session=session) for t in settings.helper_bot_tokens]
+        pool = BotTokenPool(bot, helpers, rate_per_token=settings.helper_token_rate)
+        logger.info("Membership checks spread across %s helper bots", len(helpers))
+    subs = SubscriptionService(
+        bot=bot,
+        channels=settings.required_channels,
+        ttl_seconds=settings.cache_ttl_seconds,
+        store=store,
+        breaker=breaker,
+        fail_policy=settings.member_check_fail_policy,
+        pool=pool,
+        ttl_max_seconds=settings.cache_ttl_max_seconds,
+        ttl_growth=settings.cache_ttl_growth,
+    )
+    registry = ParticipantRegistry(settings.participants_path)
+    audit = SubscriptionAudit(
+        subs=subs,
+        registry=registry,
+        state_path=settings.audit_state_path,
+        rate_per_second=settings.audit_rate_per_second,
+        verdict_ttl_seconds=settings.audit_verdict_ttl_seconds,
+    )
+    overload = None
+    if settings.overload_enabled:
+        overload = OverloadController(
+            lag_thresholds=settings.overload_lag_thresholds,
+            inflight_thresholds=settings.overload_inflight_thresholds,
+            recover_seconds=settings.overload_recover_seconds,
+            window_seconds=settings.overload_lag_window_seconds,
+        )
+        # Устаревшие события разбирает режим догоняния — в отставание они не входят
+        stale_after = settings.catchup_threshold_seconds if settings.catchup_threshold_seconds > 0 else None
+        dp.update.outer_middleware(OverloadMiddleware(overload, stale_after=stale_after))
+    catchup = None
+    if settings.catchup_threshold_seconds > 0:
+        catchup = CatchUpBatcher(subs, threshold_seconds=settings.catchup_threshold_seconds, overload=overload)
+    escalation = None
+    if settings.restrict_after_deletes > 0:
+        escalation = EscalationPolicy(
+            settings.restrict_after_deletes,
+            window_seconds=settings.restrict_window_seconds,
+            max_mute_seconds=settings.restrict_max_seconds,
+        )
+    ledger = MessageLedger(settings.ledger_per_user) if settings.ledger_per_user > 0 else None
+    router = setup_handlers(settings, subs, registry, overload, store, catchup, escalation, ledger)
     dp.include_router(router)
 
     # Админ-меню: список ID берём из переменной окружения ADMIN_USER_IDS (через запятую)
-    import os
     raw_admin = os.getenv("ADMIN_USER_IDS", "")
     admin_ids = {int(x) for x in raw_admin.split(",") if x.strip().lstrip("-").isdigit()}
     logger.info("Admin IDs: %s", sorted(admin_ids) if admin_ids else "<empty>")
-    dp.include_router(setup_admin(store, admin_ids))
+    dp.include_router(setup_admin(store, admin_ids, audit, subs))
+    stats_middleware = HandlerStatsMiddleware()
+    for observer in (dp.message, dp.edited_message, dp.chat_member):
+        observer.middleware(stats_middleware)
+    return Application(bot=bot, dispatcher=dp, store=store, registry=registry, capture=capture)
+
+
+async def _normalize_channels_usernames(bot: Bot, store: ConfigStore) -> None:
+    """Нормализуем ранее сохранённые каналы: заменяем числовые ID на @username, если доступно."""
+    channels = await store.list_channels()
+    changed = False
+    for val in channels:
+        if val.lstrip("-").isdigit():
+            try:
+                chat = await bot.get_chat(int(val))
+                if getattr(chat, "username", None):
+                    await store.remove_channel(val)
+                    await store.add_channel(f"@{chat.username}")
+                    changed = True
+            except Exception:
+                pass
+    if changed:
+        logging.getLogger("app").info("Normalized channels to @usernames where available")
 
+
+async def main(settings: Optional[Settings] = None) -> None:
+    """Точка входа: создаём бота/диспетчер и запускаем поллинг."""
+    # Запись логов — в фоновом потоке, повторяющиеся строки сворачиваются
+    setup_logging()
+    logger = logging.getLogger("app")
+    if settings is None:
+        settings = load_settings()
+    loop = asyncio.get_running_loop()
+    logger.info(
+        "Event loop: %s, eager tasks: %s",
+        type(loop).__module__, "on" if loop.get_task_factory() is not None else "off",
+    )
+    app = build_application(settings)
+    await preload_channel_links(load_channel_meta(settings.channel_meta_path))
+    await _normalize_channels_usernames(app.bot, app.store)
+
+    flushers = app.background_tasks()
     logger.info("Starting polling...")
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    try:
+        await app.dispatcher.start_polling(app.bot, allowed_updates=app.dispatcher.resolve_used_update_types())
+    finally:
+        for task in flushers:
+            task.cancel()
+        await app.close()
+
+
+def run() -> None:
+    """Запуск с циклом событий по RUNTIME_MODE (uvloop, eager-задачи)."""
+    settings = load_settings()
+    runtime.run(main(settings), settings.runtime_mode)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run()
 
 
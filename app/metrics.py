@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import bisect
+import time
+from typing import Dict, List, Optional, Union
+
+
+Number = Union[int, float]
+
+
+class RollingCounter:
+    """Счётчик событий за скользящее окно из посекундных корзин.
+
+    Запись — O(1), чтение — O(число корзин), без хранения самих событий.
+    """
+
+    __slots__ = ("window", "_buckets", "_stamps")
+
+    def __init__(self, window_seconds: int = 60) -> None:
+        self.window = window_seconds
+        self._buckets: List[int] = [0] * window_seconds
+        self._stamps: List[int] = [0] * window_seconds
+
+    def add(self, value: int = 1, now: Optional[float] = None) -> None:
+        second = int(time.monotonic() if now is None else now)
+        idx = second % self.window
+        if self._stamps[idx] != second:
+            self._stamps[idx] = second
+            self._buckets[idx] = 0
+        self._buckets[idx] += value
+
+    def total(self, now: Optional[float] = None) -> int:
+        second = int(time.monotonic() if now is None else now)
+        oldest = second - self.window
+        return sum(b for b, s in zip(self._buckets, self._stamps) if s > oldest)
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """Событий в секунду за окно."""
+        return self.total(now) / float(self.window)
+
+
+# Границы корзин гистограммы латентности, сек: от 0.5 мс до ~30 с
+LATENCY_BOUNDS: List[float] = [0.0005 * (1.6 ** i) for i in range(24)]
+
+
+class RollingHistogram:
+    """Гистограмма латентности за скользящее окно (две половины окна).
+
+    Перцентили считаются по фиксированным корзинам, поэтому стоимость
+    чтения не зависит от числа наблюдений.
+    """
+
+    __slots__ = ("half", "_current", "_previous", "_started")
+
+    def __init__(self, window_seconds: int = 60) -> None:
+        self.half = window_seconds / 2.0
+        self._current: List[int] = [0] * (len(LATENCY_BOUNDS) + 1)
+        self._previous: List[int] = [0] * (len(LATENCY_BOUNDS) + 1)
+        self._started = time.monotonic()
+
+    def _rotate(self, now: float) -> None:
+        elapsed = now - self._started
+        if elapsed < self.half:
+            return
+        if elapsed < 2 * self.half:
+            self._previous = self._current
+        else:
+            self._previous = [0] * len(self._current)
+        self._current = [0] * len(self._current)
+        self._started = now
+
+    def observe(self, seconds: float) -> None:
+        self._rotate(time.monotonic())
+        self._current[bisect.bisect_left(LATENCY_BOUNDS, seconds)] += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Верхняя граница корзины, в которую попадает q-й перцентиль (q от 0 до 1)."""
+        self._rotate(time.monotonic())
+        counts = [a + b for a, b in zip(self._current, self._previous)]
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for idx, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BOUNDS[idx] if idx < len(LATENCY_BOUNDS) else LATENCY_BOUNDS[-1]
+        return LATENCY_BOUNDS[-1]
+
+
+class MetricsRegistry:
+    """Внутренние счётчики и показатели (gauge) процесса бота.
+
+    Без внешних зависимостей: значения живут в памяти и читаются
+    через `snapshot()` — для логов и админских отчётов. Каждый счётчик
+    дополнительно ведёт скользящее окно, из которого берутся скорости
+    (`rate`), а `observe` копит латентность для перцентилей.
+    """
+
+    def __init__(self, window_seconds: int = 60) -> None:
+        self.window_seconds = window_seconds
+        self._counters: Dict[str, int] = {}
+        self._gauges: Dict[str, Number] = {}
+        self._rolling: Dict[str, RollingCounter] = {}
+        self._latency: Dict[str, RollingHistogram] = {}
+
+    def inc(self, name: str, value: int = 1) -> None:
+        self._counters[name] = self._counters.get(name, 0) + value
+        rolling = self._rolling.get(name)
+        if rolling is None:
+            rolling = self._rolling[name] = RollingCounter(self.window_seconds)
+        rolling.add(value)
+
+    def set_gauge(self, name: str, value: Number) -> None:
+        self._gauges[name] = value
+
+    def add_gauge(self, name: str, delta: Number) -> None:
+        self._gauges[name] = self._gauges.get(name, 0) + delta
+
+    def observe(self, name: str, seconds: float) -> None:
+        histogram = self._latency.get(name)
+        if histogram is None:
+            histogram = self._latency[name] = RollingHistogram(self.window_seconds)
+        histogram.observe(seconds)
+
+    def counter(self, name: str) -> int:
+        return self._counters.get(name, 0)
+
+    def gauge(self, name: str) -> Number:
+        return self._gauges.get(name, 0)
+
+    def rate(self, name: str) -> float:
+        """Событий в секунду за скользящее окно."""
+        rolling = self._rolling.get(name)
+        return rolling.rate() if rolling is not None else 0.0
+
+    def windowed(self, name: str) -> int:
+        """Число событий за скользящее окно."""
+        rolling = self._rolling.get(name)
+        return rolling.total() if rolling is not None else 0
+
+    def percentile(self, name: str, q: float) -> Optional[float]:
+        histogram = self._latency.get(name)
+        return histogram.percentile(q) if histogram is not None else None
+
+    def names(self, prefix: str) -> List[str]:
+        return sorted(n for n in self._counters if n.startswith(prefix))
+
+    def snapshot(self) -> Dict[str, Number]:
+        data: Dict[str, Number] = dict(self._counters)
+        data.update(self._gauges)
+        return data
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from .metrics import metrics
+
+
+logger = logging.getLogger("overload")
+
+
+# Ступени деградации: каждая следующая включает ограничения предыдущих
+NORMAL = 0
+NO_GREETINGS = 1        # не отправляем приветствия
+COLLAPSE_REMINDERS = 2  # одно напоминание на чат, без разрешения инвайт-ссылок
+DELETE_ONLY = 3         # удаляем без напоминаний
+CACHED_ONLY = 4         # проверка подписки только по кэшу
+
+STAGE_NAMES = {
+    NORMAL: "normal",
+    NO_GREETINGS: "no_greetings",
+    COLLAPSE_REMINDERS: "collapse_reminders",
+    DELETE_ONLY: "delete_only",
+    CACHED_ONLY: "cached_only",
+}
+
+
+def update_date(update: Update) -> Optional[float]:
+    """Время создания события в апдейте (unix time), если оно есть.
+
+    Для правок это время правки: `date` у них — время отправки исходного сообщения.
+    """
+    edited = update.edited_message
+    if edited is not None and edited.edit_date:
+        # В aiogram edit_date — целое unix time, а не datetime
+        return float(edited.edit_date)
+    event = update.message or edited or update.chat_member or update.my_chat_member
+    date = getattr(event, "date", None)
+    if date is None:
+        return None
+    return date.timestamp()
+
+
+class OverloadController:
+    """Определяет ступень деградации по отставанию апдейтов и числу активных обработчиков.
+
+    Отставание — максимум `now - date` по апдейтам за последние
+    `window_seconds`: старые замеры выпадают из окна со временем,
+    а не только по приходу новых апдейтов. Ступень повышается сразу
+    при превышении порога, а понижается на одну за каждые
+    `recover_seconds`, пока оба сигнала держатся ниже половины
+    порога текущей ступени (после затишья — сразу на несколько).
+    """
+
+    def __init__(
+        self,
+        lag_thresholds: Sequence[float] = (2.0, 5.0, 15.0, 30.0),
+        inflight_thresholds: Sequence[int] = (50, 100, 200, 400),
+        recover_seconds: float = 5.0,
+        window_seconds: float = 5.0,
+    ) -> None:
+        self.lag_thresholds: List[float] = list(lag_thresholds)
+        self.inflight_thresholds: List[int] = list(inflight_thresholds)
+        self.recover_seconds = max(recover_seconds, 0.001)
+        self.window_seconds = window_seconds
+        self.stage = NORMAL
+        self.lag = 0.0
+        self.inflight = 0
+        # (monotonic-время замера, отставание); максимум по окну — в начале очереди
+        self._samples: Deque[Tuple[float, float]] = deque()
+        self._calm_since: Optional[float] = None
+        self._last_observed: Optional[float] = None
+        metrics.set_gauge("overload.stage", NORMAL)
+
+    def _stage_for(self, lag: float, inflight: int, scale: float = 1.0) -> int:
+        stage = NORMAL
+        for idx, threshold in enumerate(self.lag_thresholds, start=1):
+            if lag >= threshold * scale:
+                stage = max(stage, idx)
+        for idx, threshold in enumerate(self.inflight_thresholds, start=1):
+            if inflight >= threshold * scale:
+                stage = max(stage, idx)
+        return min(stage, CACHED_ONLY)
+
+    def _update_lag(self, now: float, age: Optional[float]) -> None:
+        samples = self._samples
+        if age is not None:
+            age = max(age, 0.0)
+            # Монотонная очередь: замеры меньше нового уже не станут максимумом
+            while samples and samples[-1][1] <= age:
+                samples.pop()
+            samples.append((now, age))
+        while samples and samples[0][0] < now - self.window_seconds:
+            samples.popleft()
+        self.lag = samples[0][1] if samples else 0.0
+
+    def observe(self, age: Optional[float]) -> None:
+        now = time.monotonic()
+        last, self._last_observed = self._last_observed, now
+        self._update_lag(now, age)
+        wanted = self._stage_for(self.lag, self.inflight)
+        if wanted > self.stage:
+            self._calm_since = None
+            self._set_stage(wanted)
+            return
+        if self.stage == NORMAL:
+            return
+        # Гистерезис: спускаемся, только если нагрузка заметно ниже порога текущей ступени
+        if self._stage_for(self.lag, self.inflight, scale=0.5) >= self.stage:
+            self._calm_since = None
+            return
+        if self._calm_since is None:
+            # Прошлый замер был «горячим»; без апдейтов затишье началось, когда он выпал из окна
+            self._calm_since = now if last is None else min(now, last + self.window_seconds)
+        steps = int((now - self._calm_since) // self.recover_seconds)
+        if steps > 0:
+            self._calm_since += steps * self.recover_seconds
+            self._set_stage(max(self.stage - steps, NORMAL))
+
+    def reset(self) -> None:
+        """Забыть замеры и вернуться к обычному режиму (например, после догоняния)."""
+        self._samples.clear()
+        self.lag = 0.0
+        self._calm_since = None
+        if self.stage != NORMAL:
+            self._set_stage(NORMAL)
+
+    def _set_stage(self, stage: int) -> None:
+        previous, self.stage = self.stage, stage
+        metrics.set_gauge("overload.stage", stage)
+        metrics.inc(f"overload.enter.{STAGE_NAMES[stage]}")
+        log = logger.warning if stage > previous else logger.info
+        log(
+            "overload stage %s -> %s (lag=%.1fs, inflight=%s)",
+            STAGE_NAMES[previous], STAGE_NAMES[stage], self.lag, self.inflight,
+        )
+
+    def allows(self, stage: int) -> bool:
+        """True, если поведение ступени `stage` ещё не отключено (текущая ступень ниже)."""
+        return self.stage < stage
+
+
+class OverloadMiddleware(BaseMiddleware):
+    """Внешняя middleware апдейтов: считает отставание и число активных обработчиков.
+
+    События старше `stale_after` секунд разбирает режим догоняния,
+    поэтому в отставание они не попадают.
+    """
+
+    def __init__(self, controller: OverloadController, stale_after: Optional[float] = None) -> None:
+        self.controller = controller
+        self.stale_after = stale_after
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        controller = self.controller
+        date = update_date(event) if isinstance(event, Update) else None
+        age = time.time() - date if date is not None else None
+        if age is not None and self.stale_after is not None and age > self.stale_after:
+            age = None
+        controller.observe(age)
+        controller.inflight += 1
+        try:
+            return await handler(event, data)
+        finally:
+            controller.inflight -= 1
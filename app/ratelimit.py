@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Ограничитель скорости «ведро токенов».
+
+    `rate` — токенов в секунду, `capacity` — допустимый всплеск.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = max(float(rate), 0.001)
+        self.capacity = float(capacity) if capacity is not None else max(self.rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        # Запрос больше ёмкости ведра ждёт, пока накопится вся ёмкость
+        tokens = min(float(tokens), self.capacity)
+        while not self.try_acquire(tokens):
+            await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def penalize(self, seconds: float) -> None:
+        """Опустошить ведро на `seconds` секунд (например, после RetryAfter)."""
+        self._refill()
+        self._tokens = -float(seconds) * self.rate
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+from typing import Any, Callable, Coroutine, Optional, Tuple
+
+
+logger = logging.getLogger("runtime")
+
+# auto — всё, что доступно в окружении
+RUNTIME_MODES = ("auto", "asyncio", "uvloop", "eager", "uvloop+eager")
+
+
+def uvloop_available() -> bool:
+    try:
+        import uvloop  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def eager_available() -> bool:
+    # asyncio.eager_task_factory появился в Python 3.12
+    return hasattr(asyncio, "eager_task_factory")
+
+
+def resolve_mode(mode: str) -> Tuple[bool, bool]:
+    """(uvloop, eager) для режима; недоступное отключается с предупреждением."""
+    mode = (mode or "auto").strip().lower()
+    if mode not in RUNTIME_MODES:
+        logger.warning("unknown runtime mode %r, using asyncio", mode)
+        return False, False
+    if mode == "auto":
+        return uvloop_available(), eager_available()
+    want_uvloop = "uvloop" in mode
+    want_eager = "eager" in mode
+    if want_uvloop and not uvloop_available():
+        logger.warning("uvloop is not installed, using the default event loop")
+        want_uvloop = False
+    if want_eager and not eager_available():
+        logger.warning("eager task factory needs Python 3.12+, running on %s", sys.version.split()[0])
+        want_eager = False
+    return want_uvloop, want_eager
+
+
+def describe(mode: str) -> str:
+    use_uvloop, use_eager = resolve_mode(mode)
+    parts = ["uvloop" if use_uvloop else "asyncio"]
+    if use_eager:
+        parts.append("eager")
+    return "+".join(parts)
+
+
+def _loop_factory(use_uvloop: bool) -> Optional[Callable[[], asyncio.AbstractEventLoop]]:
+    if not use_uvloop:
+        return None
+    import uvloop
+
+    return uvloop.new_event_loop
+
+
+def new_event_loop(mode: str) -> asyncio.AbstractEventLoop:
+    """Цикл событий для режима (для запуска через сторонний раннер, например aiohttp)."""
+    use_uvloop, use_eager = resolve_mode(mode)
+    factory = _loop_factory(use_uvloop)
+    loop = factory() if factory is not None else asyncio.new_event_loop()
+    if use_eager:
+        loop.set_task_factory(asyncio.eager_task_factory)  # type: ignore[attr-defined]
+    return loop
+
+
+def run(main: Coroutine[Any, Any, Any], mode: str = "asyncio") -> Any:
+    """Аналог `asyncio.run` с выбором цикла событий и фабрики задач.
+
+    В режиме eager задача начинает выполняться прямо в `create_task`
+    и, если до первого `await` не дошла до ожидания ввода-вывода
+    (например, проверка подписки по кэшу), завершается без прохода
+    через планировщик.
+    """
+    use_uvloop, use_eager = resolve_mode(mode)
+    with asyncio.Runner(loop_factory=_loop_factory(use_uvloop)) as runner:
+        if use_eager:
+            runner.get_loop().set_task_factory(asyncio.eager_task_factory)  # type: ignore[attr-defined]
+        return runner.run(main)
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from .metrics import metrics
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+
+logger = logging.getLogger("session")
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """HTTP-сессия Bot API с настраиваемым пулом соединений.
+
+    Размер пула, keep-alive и время жизни DNS-кэша задаются явно,
+    а для отдельных методов (например, `getChatMember`) можно указать
+    собственный таймаут, не затрагивая массовые отправки.
+    `api_url` — адрес локального Bot API сервера (или заглушки в бенчмарках).
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 100,
+        keepalive_seconds: float = 30.0,
+        dns_ttl_seconds: int = 300,
+        method_timeouts: Optional[Dict[str, float]] = None,
+        api_url: str = "",
+        **kwargs: Any,
+    ) -> None:
+        if api_url:
+            kwargs.setdefault("api", TelegramAPIServer.from_base(api_url))
+        super().__init__(limit=pool_size, **kwargs)
+        self._connector_init.update(
+            {
+                "keepalive_timeout": float(keepalive_seconds),
+                "ttl_dns_cache": int(dns_ttl_seconds),
+            }
+        )
+        self.method_timeouts: Dict[str, float] = dict(method_timeouts or {})
+
+    async def make_request(
+        self, bot: Bot, method: TelegramMethod[TelegramType], timeout: Optional[int] = None
+    ) -> TelegramType:
+        metrics.inc(f"api.{method.__api_method__}")
+        # Явно переданный таймаут (например, у long polling) имеет приоритет
+        if timeout is None:
+            timeout = self.method_timeouts.get(method.__api_method__)  # type: ignore[assignment]
+        return await super().make_request(bot, method, timeout=timeout)
+
+    def pool_stats(self) -> Tuple[int, int]:
+        """Текущая загрузка пула: (занято соединений, лимит)."""
+        limit = int(self._connector_init.get("limit", 0) or 0)
+        if self._session is None or self._session.closed:
+            return 0, limit
+        connector = self._session.connector
+        in_use = len(getattr(connector, "_acquired", ()) or ())
+        return in_use, limit
+
+
+class CircuitBreaker:
+    """Простой автомат closed → open → half-open для вызовов API.
+
+    После `failure_threshold` подряд неудачных вызовов переходит в open
+    и `reset_seconds` секунд отказывает сразу. Затем пропускает один
+    пробный вызов (half-open): успех закрывает цепь, неудача — снова open.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        session: Optional[TunedAiohttpSession] = None,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = float(reset_seconds)
+        self.session = session
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        metrics.set_gauge(f"breaker.{self.name}.open", 0)
+
+    def allow_request(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self._transition(self.HALF_OPEN)
+        # half-open: пропускаем ровно один пробный вызов
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._probe_in_flight = False
+        if self.state != self.CLOSED:
+            self._transition(self.CLOSED)
+
+    def release_probe(self) -> None:
+        """Пробный вызов не дал ответа (например, отменён): следующий запрос станет пробным."""
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            if self.state != self.OPEN:
+                self._transition(self.OPEN)
+
+    def _transition(self, state: str) -> None:
+        previous, self.state = self.state, state
+        metrics.inc(f"breaker.{self.name}.{state}")
+        metrics.set_gauge(f"breaker.{self.name}.open", 0 if state == self.CLOSED else 1)
+        in_use, limit = self.session.pool_stats() if self.session is not None else (0, 0)
+        logger.warning(
+            "circuit %s: %s -> %s (failures=%s, pool %s/%s)",
+            self.name, previous, state, self._failures, in_use, limit,
+        )
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from .handlers import _channel_links, _last_notice_message, _notice_cache, _welcomed_cache
+from .metrics import metrics
+from .subscription import SubscriptionService
+
+
+class HandlerStatsMiddleware(BaseMiddleware):
+    """Внутренняя middleware: число вызовов и латентность каждого обработчика."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.inc(f"handler.{name}")
+            metrics.observe("handlers", elapsed)
+
+
+def _format_bytes(value: int) -> str:
+    if value >= 1024 * 1024:
+        return f"{value / (1024 * 1024):.1f} МБ"
+    return f"{value / 1024:.0f} КБ"
+
+
+def render_stats(subs: Optional[SubscriptionService] = None) -> str:
+    """Текст для /stats: только готовые счётчики и окна, без обхода данных."""
+    window = metrics.window_seconds
+    lines: List[str] = [f"📊 Статистика (окно {window} с)"]
+
+    handler_names = metrics.names("handler.")
+    if handler_names:
+        lines.append("Апдейты/с по обработчикам:")
+        for name in handler_names:
+            lines.append(f"• {name[len('handler.'):]}: {metrics.rate(name):.2f}")
+    p95 = metrics.percentile("handlers", 0.95)
+    lines.append("p95 обработчиков: " + (f"{p95 * 1000:.0f} мс" if p95 is not None else "—"))
+
+    lines.append(
+        f"Удалено сообщений: {metrics.windowed('messages.deleted')} "
+        f"(всего {metrics.counter('messages.deleted')})"
+    )
+    lines.append(
+        f"Напоминаний: {metrics.windowed('reminders.sent')}, "
+        f"приветствий: {metrics.windowed('greetings.sent')}"
+    )
+
+    hits = metrics.windowed("subscription.cache_hit")
+    misses = metrics.windowed("subscription.cache_miss")
+    ratio = f"{100.0 * hits / (hits + misses):.0f}%" if hits + misses else "—"
+    lines.append(f"Кэш подписок: попадания {ratio} ({hits}/{hits + misses})")
+    per_minute = metrics.rate("api.getChatMember") * 60
+    lines.append(f"getChatMember: {per_minute:.0f}/мин")
+    saved = metrics.windowed("subscription.ttl_saved_calls")
+    if saved or metrics.counter("subscription.ttl_saved_calls"):
+        lines.append(
+            f"Адаптивный TTL сэкономил getChatMember: {saved} "
+            f"(всего {metrics.counter('subscription.ttl_saved_calls')})"
+        )
+
+    caches = {
+        "приветствия": _welcomed_cache,
+        "напоминания": _notice_cache,
+        "id напоминаний": _last_notice_message,
+        "ссылки каналов": _channel_links,
+    }
+    if subs is not None:
+        caches["подписки"] = subs.cache
+        caches["стаж подписки"] = subs.tenure
+    lines.append("Память кэшей:")
+    for label, cache in caches.items():
+        lines.append(f"• {label}: {len(cache)} записей, ~{_format_bytes(cache.approx_bytes())}")
+
+    lines.append(f"Отложенных удалений: {int(metrics.gauge('deletions.pending'))}")
+    if metrics.counter("escalation.restrict_calls"):
+        lines.append(
+            f"Ограничено сейчас: {int(metrics.gauge('escalation.muted'))}, "
+            f"вызовов restrict: {metrics.counter('escalation.restrict_calls')}, "
+            f"сэкономлено (грубая оценка) ~{metrics.counter('escalation.calls_saved_rough')} вызовов API"
+        )
+    if metrics.counter("ledger.edit_answered") or metrics.counter("ledger.retro_deleted"):
+        lines.append(
+            f"Правок без проверки подписки: {metrics.counter('ledger.edit_answered')}, "
+            f"удалено задним числом: {metrics.counter('ledger.retro_deleted')}"
+        )
+    return "\n".join(lines)
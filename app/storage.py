@@ -1,33 +1,99 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
 import os
 import tempfile
 from dataclasses import dataclass, asdict
-from typing import List, Optional
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
 from asyncio import Lock
 
 
+logger = logging.getLogger("storage")
+
+
 @dataclass
 class StoredConfig:
     chat_id: Optional[int]
     required_channels: List[str]
 
 
+class ChannelIndex:
+    """Множества обязательных каналов для быстрой классификации событий.
+
+    Строится один раз из списка каналов: @username сравниваются
+    без учёта регистра, числовые ID — как int.
+    """
+
+    __slots__ = ("usernames", "ids")
+
+    def __init__(self, channels: Iterable[str]) -> None:
+        channels = list(channels)
+        self.usernames: FrozenSet[str] = frozenset(c.lower() for c in channels if not c.lstrip("-").isdigit())
+        self.ids: FrozenSet[int] = frozenset(int(c) for c in channels if c.lstrip("-").isdigit())
+
+    def matches(self, chat_id: int, username: Optional[str]) -> bool:
+        if chat_id in self.ids:
+            return True
+        return bool(username) and ("@" + username.lower()) in self.usernames
+
+
+def load_channel_meta(path: str) -> Dict[str, Tuple[str, Optional[str]]]:
+    """Заранее разрешённые ссылки на каналы: ID → (текст ссылки, URL).
+
+    Файл готовит `python -m app.webhook --resolve-channels`; если его нет
+    или он повреждён, возвращается пустой словарь и ссылки разрешаются по сети.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {str(k): (v[0], v[1]) for k, v in data.items() if isinstance(v, list) and len(v) == 2}
+
+
+def save_channel_meta(path: str, links: Dict[str, Tuple[str, Optional[str]]]) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_fd, tmp_path = tempfile.mkstemp(prefix="meta_", suffix=".json", dir=directory)
+    with os.fdopen(tmp_fd, "w", encoding="utf-8") as f:
+        json.dump({k: list(v) for k, v in links.items()}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
 class ConfigStore:
     """Простое файловое хранилище настроек (JSON).
 
-    Потокобезопасные операции чтения/записи через `asyncio.Lock`.
+    Настройки читаются с диска один раз и дальше живут в памяти:
+    чтения не трогают файл, изменения применяются сразу, а на диск
+    их сбрасывает фоновая запись в пуле потоков. Несколько изменений
+    подряд сливаются в одну запись (atomic replace + fsync файла и каталога).
+    Неудачная фоновая запись повторяется через `retry_seconds`.
+    Перед завершением процесса вызовите `close()` — он дождётся записи
+    и пробросит OSError, если сохранить изменения так и не удалось.
     Формат файла: {"chat_id": int | null, "required_channels": [str, ...]}.
+    `version` увеличивается при каждом изменении — по нему можно
+    перестраивать производные структуры (например, `ChannelIndex`).
     """
 
-    def __init__(self, path: str) -> None:
+    def __init__(self, path: str, write_delay: float = 0.05, retry_seconds: float = 5.0) -> None:
         self.path = path
+        self.version = 0
+        self.write_delay = write_delay
+        self.retry_seconds = retry_seconds
         self._lock = Lock()
+        self._dirty = False
+        self._writer: Optional[asyncio.Task] = None
+        self._retry: Optional[asyncio.TimerHandle] = None
+        self._last_error: Optional[OSError] = None
         # Убедимся, что каталог существует
         os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._cfg = self._read()
 
-    async def _load(self) -> StoredConfig:
+    def _read(self) -> StoredConfig:
         if not os.path.exists(self.path):
             return StoredConfig(chat_id=None, required_channels=[])
         with open(self.path, "r", encoding="utf-8") as f:
@@ -37,12 +103,22 @@ class ConfigStore:
             required_channels=list(data.get("required_channels", [])),
         )
 
-    async def _save(self, cfg: StoredConfig) -> None:
-        tmp_fd, tmp_path = tempfile.mkstemp(prefix="cfg_", suffix=".json", dir=os.path.dirname(self.path))
+    def _write(self, data: dict) -> None:
+        """Атомарная и надёжная запись на диск (выполняется вне event loop)."""
+        directory = os.path.dirname(self.path)
+        tmp_fd, tmp_path = tempfile.mkstemp(prefix="cfg_", suffix=".json", dir=directory)
         try:
             with os.fdopen(tmp_fd, "w", encoding="utf-8") as f:
-                json.dump(asdict(cfg), f, ensure_ascii=False, indent=2)
+                json.dump(data, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
             os.replace(tmp_path, self.path)
+            # fsync каталога фиксирует сам rename
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
         finally:
             if os.path.exists(tmp_path):
                 try:
@@ -50,19 +126,71 @@ class ConfigStore:
                 except OSError:
                     pass
 
+    def _changed(self) -> None:
+        """Отметить изменение и запланировать фоновую запись."""
+        self.version += 1
+        self._dirty = True
+        self._start_writer()
+
+    def _start_writer(self) -> None:
+        self._retry = None
+        if self._dirty and (self._writer is None or self._writer.done()):
+            self._writer = asyncio.create_task(self._write_behind())
+
+    async def _write_behind(self) -> None:
+        # Короткая пауза собирает серию изменений в одну запись
+        if self.write_delay > 0:
+            await asyncio.sleep(self.write_delay)
+        if not await self._write_pending() and self._retry is None:
+            self._retry = asyncio.get_running_loop().call_later(self.retry_seconds, self._start_writer)
+
+    async def _write_pending(self) -> bool:
+        """Записать накопленные изменения. False — запись не удалась, изменения остались в памяти."""
+        loop = asyncio.get_running_loop()
+        while self._dirty:
+            self._dirty = False
+            data = asdict(self._cfg)
+            try:
+                await loop.run_in_executor(None, self._write, data)
+            except OSError as exc:
+                self._dirty = True
+                self._last_error = exc
+                logger.exception("config store write failed: %s", self.path)
+                return False
+        self._last_error = None
+        return True
+
+    def _cancel_retry(self) -> None:
+        if self._retry is not None:
+            self._retry.cancel()
+            self._retry = None
+
+    async def flush(self) -> None:
+        """Дождаться, пока все изменения окажутся на диске.
+
+        Пробрасывает OSError, если и последняя попытка записи не удалась.
+        """
+        self._cancel_retry()
+        if self._writer is not None and not self._writer.done():
+            await self._writer
+        self._cancel_retry()
+        if self._dirty and not await self._write_pending():
+            assert self._last_error is not None
+            raise self._last_error
+
+    async def close(self) -> None:
+        await self.flush()
+
     async def get_chat_id(self) -> Optional[int]:
-        async with self._lock:
-            return (await self._load()).chat_id
+        return self._cfg.chat_id
 
     async def set_chat_id(self, chat_id: int) -> None:
         async with self._lock:
-            cfg = await self._load()
-            cfg.chat_id = int(chat_id)
-            await self._save(cfg)
+            self._cfg.chat_id = int(chat_id)
+            self._changed()
 
     async def list_channels(self) -> List[str]:
-        async with self._lock:
-            return list((await self._load()).required_channels)
+        return list(self._cfg.required_channels)
 
     async def add_channel(self, channel: str) -> bool:
         """Добавить канал. Возвращает True, если добавлен (не было дубликата)."""
@@ -72,20 +200,18 @@ class ConfigStore:
         if not norm.lstrip("-").isdigit() and not norm.startswith("@"):
             norm = f"@{norm}"
         async with self._lock:
-            cfg = await self._load()
-            if norm in cfg.required_channels:
+            if norm in self._cfg.required_channels:
                 return False
-            cfg.required_channels.append(norm)
-            await self._save(cfg)
+            self._cfg.required_channels.append(norm)
+            self._changed()
             return True
 
     async def remove_channel(self, value: str) -> bool:
         """Удалить канал по точному значению. Возвращает True, если был удалён."""
         async with self._lock:
-            cfg = await self._load()
-            if value in cfg.required_channels:
-                cfg.required_channels.remove(value)
-                await self._save(cfg)
+            if value in self._cfg.required_channels:
+                self._cfg.required_channels.remove(value)
+                self._changed()
                 return True
             return False
 import json
@@ -3,52 +3,200 @@ from __future__ import annotations
 from typing import Iterable, Optional, List
 
 from aiogram import Bot
-from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+    TelegramUnauthorizedError,
+)
 from aiogram.types import ChatMember
 
-from .cache import TTLMemoryCache
+from .cache import TTLKVCache, TTLMemoryCache
+from .session import CircuitBreaker
+from .token_pool import BotTokenPool
 from .storage import ConfigStore
+from .metrics import metrics
+import asyncio
 import logging
+import time
+
+
+# Фрагменты ответа BadRequest, означающие, что у бота нет прав читать участников канала
+_NO_RIGHTS_MARKERS = (
+    "member list is inaccessible",
+    "not enough rights",
+    "chat_admin_required",
+    "need administrator rights",
+    "bot is not a member",
+)
+
+
+def _lacks_rights(exc: TelegramBadRequest) -> bool:
+    text = (exc.message or "").lower()
+    return any(marker in text for marker in _NO_RIGHTS_MARKERS)
 
 
 class SubscriptionService:
     """Сервис проверки подписки пользователя на все обязательные каналы.
 
     Использует TTL-кэш в памяти, чтобы сократить число запросов к API.
+    Если задан `breaker`, при деградации API проверки не выполняются,
+    а результат определяется политикой `fail_policy` (allow/deny).
+    Если задан `pool`, запросы getChatMember идут через вспомогательных
+    ботов, а лимит основного бота остаётся модерации.
+
+    Срок вердикта адаптивный: каждая повторная успешная проверка
+    умножает его на `ttl_growth` (но не выше `ttl_max_seconds`), а выход
+    из канала или отрицательный результат сбрасывают его к `ttl_seconds`.
+    Параллельно моделируется фиксированный TTL, чтобы считать,
+    сколько вызовов getChatMember сэкономлено. При изменении настроек
+    в `store` (его `version`) вердикты и стаж сбрасываются: долгий
+    вердикт не должен пережить добавление нового канала.
     """
 
-    def __init__(self, bot: Bot, channels: Iterable[str], ttl_seconds: int, store: Optional[ConfigStore] = None) -> None:
+    def __init__(
+        self,
+        bot: Bot,
+        channels: Iterable[str],
+        ttl_seconds: int,
+        store: Optional[ConfigStore] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        fail_policy: str = "allow",
+        pool: Optional[BotTokenPool] = None,
+        ttl_max_seconds: Optional[int] = None,
+        ttl_growth: float = 2.0,
+    ) -> None:
         self.bot = bot
         self.channels = list(channels)
         self.cache = TTLMemoryCache()
         self.ttl_seconds = ttl_seconds
         self.store = store
+        self.breaker = breaker
+        self.fail_policy = fail_policy
+        self.pool = pool
+        self.ttl_max_seconds = max(ttl_seconds, ttl_max_seconds or ttl_seconds)
+        self.ttl_growth = max(1.0, ttl_growth)
+        # user_id → [текущий срок вердикта, когда истёк бы фиксированный TTL]
+        self.tenure = TTLKVCache()
+        self._version = store.version if store is not None else 0
         self.logger = logging.getLogger("subscription")
 
-    def _cache_key(self, user_id: int) -> str:
-        return f"subscribed:{user_id}"
+    @property
+    def adaptive(self) -> bool:
+        return self.ttl_max_seconds > self.ttl_seconds and self.ttl_growth > 1.0
+
+    def channels_version(self) -> int:
+        """Версия настроек, к которой относятся вердикты в кэше; при смене кэш сбрасывается."""
+        if self.store is not None and self.store.version != self._version:
+            self._version = self.store.version
+            self.cache.clear()
+            self.tenure.clear()
+            metrics.inc("subscription.cache_reset")
+            self.logger.info("required channels changed, subscription verdicts dropped")
+        return self._version
 
-    async def is_fully_subscribed(self, user_id: int) -> bool:
+    def _cache_key(self, user_id: int) -> int:
+        # Кэш принадлежит только этому сервису — префикс не нужен, ключ — сам user_id
+        return user_id
+
+    async def is_fully_subscribed(self, user_id: int, cached_only: bool = False) -> bool:
+        """Подписан ли пользователь на все каналы.
+
+        При `cached_only=True` (перегрузка) в API не ходим: без записи
+        в кэше пользователь считается неподписанным. Это политика
+        нагрузки, а не сбой API, поэтому `fail_policy` здесь не действует.
+        """
         key = self._cache_key(user_id)
+        version = self.channels_version()
         if await self.cache.contains(key):
+            metrics.inc("subscription.cache_hit")
+            if self.adaptive:
+                await self._count_saved(key)
             return True
+        metrics.inc("subscription.cache_miss")
+        if cached_only:
+            metrics.inc("subscription.cached_only_miss")
+            return False
+
+        verdict = await self.verify(user_id, await self.current_channels())
+        if verdict is None:
+            return self._fallback_verdict()
+        if verdict:
+            # Пока шла проверка, набор каналов мог смениться — такой вердикт не кэшируем
+            if self.channels_version() != version:
+                return verdict
+            # Успех кэшируем, чтобы реже ходить в API; срок растёт со стажем подписки
+            await self.cache.set_until(key, await self._next_ttl(key))
+        elif self.adaptive:
+            await self.tenure.delete(key)
+        return verdict
 
-        # Берём актуальные каналы из хранилища (если оно подключено)
-        channels: List[str]
+    async def _next_ttl(self, key: int) -> int:
+        if not self.adaptive:
+            return self.ttl_seconds
+        state = await self.tenure.get(key)
+        ttl = self.ttl_seconds if state is None else min(int(state[0] * self.ttl_growth), self.ttl_max_seconds)
+        # Стаж забывается, если пользователь долго не появлялся
+        await self.tenure.set(key, [ttl, time.monotonic() + self.ttl_seconds], self.ttl_max_seconds * 2)
+        return ttl
+
+    async def _count_saved(self, key: int) -> None:
+        """Попадание, которое при фиксированном TTL было бы новой проверкой всех каналов."""
+        state = await self.tenure.get(key)
+        if state is None:
+            return
+        now = time.monotonic()
+        if now > state[1]:
+            state[1] = now + self.ttl_seconds
+            metrics.inc("subscription.ttl_saved_calls", len(await self.current_channels()))
+
+    async def invalidate(self, user_id: int) -> None:
+        """Забыть вердикт и стаж (выход из обязательного канала)."""
+        key = self._cache_key(user_id)
+        await self.cache.delete(key)
+        await self.tenure.delete(key)
+
+    async def current_channels(self) -> List[str]:
+        """Актуальные каналы из хранилища (если оно подключено) либо из окружения."""
         if self.store is not None:
             channels = await self.store.list_channels()
-            if not channels:
-                channels = self.channels
-        else:
-            channels = self.channels
+            if channels:
+                return channels
+        return list(self.channels)
+
+    async def verify(self, user_id: int, channels: Iterable[str]) -> Optional[bool]:
+        """Проверить подписку через API, минуя кэш.
 
+        Возвращает None, если API недоступно (или открыт автомат отключения).
+        """
         for ch in channels:
+            if self.breaker is not None and not self.breaker.allow_request():
+                metrics.inc("subscription.breaker_short_circuit")
+                return None
             try:
-                member: ChatMember = await self.bot.get_chat_member(chat_id=ch, user_id=user_id)
+                member: ChatMember = await self._get_member(ch, user_id)
             except (TelegramBadRequest, TelegramForbiddenError):
                 # Канал приватный или бот не админ — считаем, что подписки нет
                 self.logger.debug("get_chat_member failed for %s user %s", ch, user_id)
+                self._record_api_result(ok=True)
                 return False
+            except (TelegramNetworkError, TelegramServerError, TelegramRetryAfter):
+                # API деградирует: не ждём следующих таймаутов, отвечаем по политике
+                self.logger.debug("get_chat_member unavailable for %s user %s", ch, user_id)
+                self._record_api_result(ok=False)
+                return None
+            except asyncio.CancelledError:
+                # Иначе пробный вызов half-open так и останется «в полёте»
+                if self.breaker is not None:
+                    self.breaker.release_probe()
+                raise
+            except Exception:
+                self._record_api_result(ok=False)
+                raise
+            self._record_api_result(ok=True)
 
             status = getattr(member, "status", None)
             is_member_attr = getattr(member, "is_member", None)
@@ -58,9 +206,76 @@ class SubscriptionService:
                 pass
             else:
                 return False
-
-        # Успех кэшируем, чтобы реже ходить в API
-        await self.cache.set_until(key, self.ttl_seconds)
         return True
 
+    async def _get_member(self, chat_id: str, user_id: int) -> ChatMember:
+        """getChatMember через пул ботов; при сбое вспомогательного — повтор основным."""
+        if self.pool is None:
+            return await self.bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+        bot = await self.pool.acquire()
+        if not self.pool.is_helper(bot):
+            return await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+        try:
+            member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+        except TelegramRetryAfter as exc:
+            # Исчерпан лимит конкретного токена — это не деградация API
+            self.pool.report_failure(bot, retry_after=exc.retry_after)
+        except TelegramBadRequest as exc:
+            # «user not found», «chat not found» и т.п. — настоящий ответ: основной бот получил бы тот же
+            if not _lacks_rights(exc):
+                self.pool.report_success(bot)
+                raise
+            self.logger.warning("helper bot %s cannot read members of %s: %s", bot.id, chat_id, exc.message)
+            self.pool.report_failure(bot)
+        except TelegramForbiddenError:
+            # Вспомогательный бот исключён из канала или не состоит в нём
+            self.logger.warning("helper bot %s cannot read members of %s", bot.id, chat_id)
+            self.pool.report_failure(bot)
+        except (TelegramNetworkError, TelegramServerError):
+            self.pool.report_failure(bot)
+            raise
+        except TelegramUnauthorizedError:
+            # Токен отозван: повторять через этого бота бессмысленно
+            self.pool.report_failure(bot, permanent=True)
+        except TelegramAPIError:
+            self.logger.warning("helper bot %s failed getChatMember for %s", bot.id, chat_id, exc_info=True)
+            self.pool.report_failure(bot)
+        else:
+            self.pool.report_success(bot)
+            return member
+        metrics.inc("token_pool.primary_retry")
+        return await self.bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+
+    async def store_verdict(
+        self,
+        user_id: int,
+        subscribed: bool,
+        ttl_seconds: Optional[int] = None,
+        version: Optional[int] = None,
+    ) -> None:
+        """Записать вердикт, полученный вне горячего пути (например, аудитом).
+
+        Срок не больше `ttl_max_seconds`. Если передана `version`
+        (см. `channels_version`) и набор каналов с тех пор сменился,
+        положительный вердикт отбрасывается.
+        """
+        key = self._cache_key(user_id)
+        if subscribed:
+            if version is not None and self.channels_version() != version:
+                return
+            ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_max_seconds)
+            await self.cache.set_until(key, ttl)
+        else:
+            await self.invalidate(user_id)
+
+    def _record_api_result(self, ok: bool) -> None:
+        if self.breaker is None:
+            return
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
 
+    def _fallback_verdict(self) -> bool:
+        # Вердикт по политике не кэшируем: после восстановления API проверим заново
+        return self.fail_policy != "deny"
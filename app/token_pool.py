@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import Dict, List, Optional, Sequence
+
+from aiogram import Bot
+
+from .metrics import metrics
+from .ratelimit import TokenBucket
+
+
+logger = logging.getLogger("token_pool")
+
+
+class _PooledBot:
+    __slots__ = ("bot", "bucket", "failures", "cooldown_until", "calls")
+
+    def __init__(self, bot: Bot, rate_per_second: float) -> None:
+        self.bot = bot
+        self.bucket = TokenBucket(rate_per_second)
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.calls = 0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+
+class BotTokenPool:
+    """Пул вспомогательных ботов для проверок подписки (getChatMember).
+
+    Каждый вспомогательный бот должен быть администратором обязательных
+    каналов. Запросы распределяются по кругу с учётом лимита скорости
+    на токен; бот с ошибками временно выводится из ротации. Основной бот
+    используется, только если здоровых вспомогательных не осталось —
+    его лимит остаётся модерации в чате.
+    """
+
+    def __init__(
+        self,
+        primary: Bot,
+        helpers: Sequence[Bot],
+        rate_per_token: float = 20.0,
+        cooldown_seconds: float = 30.0,
+        max_failures: int = 3,
+    ) -> None:
+        self.primary = primary
+        self.rate_per_token = rate_per_token
+        self.cooldown_seconds = cooldown_seconds
+        self.max_failures = max(1, int(max_failures))
+        self._helpers: List[_PooledBot] = [_PooledBot(b, rate_per_token) for b in helpers]
+        self._by_bot: Dict[int, _PooledBot] = {id(p.bot): p for p in self._helpers}
+        self._next = 0
+        metrics.set_gauge("token_pool.healthy", len(self._helpers))
+
+    def __len__(self) -> int:
+        return len(self._helpers)
+
+    async def acquire(self) -> Bot:
+        """Выбрать бота для очередного запроса, дождавшись его лимита скорости."""
+        now = time.monotonic()
+        count = len(self._helpers)
+        waiting: Optional[int] = None
+        for step in range(count):
+            idx = (self._next + step) % count
+            candidate = self._helpers[idx]
+            if not candidate.healthy(now):
+                continue
+            if candidate.bucket.try_acquire():
+                return self._take(idx)
+            if waiting is None:
+                waiting = idx
+        if waiting is None:
+            metrics.inc("token_pool.primary_fallback")
+            return self.primary
+        # Все здоровые боты исчерпали лимит — ждём ближайшего по очереди
+        await self._helpers[waiting].bucket.acquire()
+        return self._take(waiting)
+
+    def _take(self, idx: int) -> Bot:
+        self._next = (idx + 1) % len(self._helpers)
+        pooled = self._helpers[idx]
+        pooled.calls += 1
+        metrics.inc(f"token_pool.{pooled.bot.id}.calls")
+        return pooled.bot
+
+    def report_success(self, bot: Bot) -> None:
+        pooled = self._by_bot.get(id(bot))
+        if pooled is not None:
+            pooled.failures = 0
+
+    def report_failure(self, bot: Bot, retry_after: Optional[float] = None, permanent: bool = False) -> None:
+        """Учесть ошибку бота; при RetryAfter или серии ошибок — вывести из ротации.
+
+        `permanent=True` (токен отозван или недействителен) выводит бота
+        из ротации до перезапуска.
+        """
+        pooled = self._by_bot.get(id(bot))
+        if pooled is None:
+            return
+        pooled.failures += 1
+        metrics.inc(f"token_pool.{bot.id}.failures")
+        if permanent:
+            pooled.cooldown_until = float("inf")
+            logger.error("helper bot %s disabled: token rejected by Telegram", bot.id)
+            self._update_health_gauge()
+            return
+        if retry_after is None and pooled.failures < self.max_failures:
+            return
+        cooldown = float(retry_after) if retry_after is not None else self.cooldown_seconds
+        pooled.cooldown_until = time.monotonic() + cooldown
+        pooled.failures = 0
+        logger.warning("helper bot %s paused for %.0fs", bot.id, cooldown)
+        self._update_health_gauge()
+
+    def is_helper(self, bot: Bot) -> bool:
+        return id(bot) in self._by_bot
+
+    def _update_health_gauge(self) -> None:
+        now = time.monotonic()
+        metrics.set_gauge("token_pool.healthy", sum(1 for p in self._helpers if p.healthy(now)))
+
+    def stats(self) -> List[Dict[str, float]]:
+        self._update_health_gauge()
+        now = time.monotonic()
+        return [
+            {"bot_id": p.bot.id, "calls": p.calls, "healthy": float(p.healthy(now))}
+            for p in self._helpers
+        ]
@@ -0,0 +1,182 @@
+"""Лёгкая точка входа для webhook-воркеров (serverless, масштабирование до нуля).
+
+В отличие от `app.main`, воркер сразу поднимает HTTP-сервер, а aiogram
+и обработчики импортирует в фоновом потоке. Пока диспетчер не готов,
+обновления получают 503 и Telegram повторяет доставку; после этого
+каждое подтверждается (200 OK) сразу и обрабатывается в фоне. При старте нет сетевых вызовов: ссылки на каналы с числовым ID
+читаются с диска (`CHANNEL_META_PATH`), а сам файл и регистрация webhook
+готовятся заранее, на этапе деплоя:
+
+    python -m app.webhook --resolve-channels
+    python -m app.webhook --set-webhook https://example.com/webhook
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hmac
+import logging
+import time
+from typing import Any, List, Optional, Set
+
+from aiohttp import web
+
+from .config import Settings, load_settings
+from .logs import setup_logging
+from .runtime import new_event_loop
+from .storage import load_channel_meta
+
+
+logger = logging.getLogger("webhook")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def _import_app() -> None:
+    """Тяжёлые импорты (aiogram, модели pydantic, обработчики)."""
+    from . import main  # noqa: F401
+
+
+class WebhookWorker:
+    """Принимает обновления по HTTP и отдаёт их диспетчеру после подтверждения."""
+
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self.started_at = time.perf_counter()
+        self.first_handled_at: Optional[float] = None
+        self._app: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._flushers: List[asyncio.Task] = []
+
+    def warm_up(self) -> None:
+        """Начать импорт и сборку диспетчера, не блокируя приём запросов."""
+        if self._app is None:
+            self._app = asyncio.create_task(self._build())
+
+    def _ready_app(self) -> Any:
+        """Собранное приложение или None; неудачная сборка сбрасывается для повтора."""
+        task = self._app
+        if task is None or not task.done():
+            return None
+        if task.cancelled() or task.exception() is not None:
+            logger.error("dispatcher build failed, retrying", exc_info=None if task.cancelled() else task.exception())
+            self._app = None
+            return None
+        return task.result()
+
+    async def _build(self) -> Any:
+        await asyncio.to_thread(_import_app)
+        from .handlers import preload_channel_links
+        from .main import build_application
+
+        app = build_application(self.settings)
+        await preload_channel_links(load_channel_meta(self.settings.channel_meta_path))
+        self._flushers = app.background_tasks()
+        logger.info("dispatcher ready in %.0f ms", (time.perf_counter() - self.started_at) * 1000)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        secret = self.settings.webhook_secret
+        if secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, "").encode(), secret.encode()):
+            return web.Response(status=401)
+        app = self._ready_app()
+        if app is None:
+            # Подтверждать нельзя: при сбое сборки апдейт был бы потерян, а так Telegram повторит доставку
+            self.warm_up()
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        task = asyncio.create_task(self._process(app, payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        # Подтверждаем сразу: Telegram не ждёт обработки и не повторяет доставку
+        return web.Response()
+
+    async def _process(self, app: Any, payload: dict) -> None:
+        try:
+            from aiogram.types import Update
+
+            update = Update.model_validate(payload, context={"bot": app.bot})
+            await app.dispatcher.feed_update(app.bot, update)
+        except Exception:
+            logger.exception("failed to handle update %s", payload.get("update_id"))
+            return
+        if self.first_handled_at is None:
+            self.first_handled_at = time.perf_counter()
+            logger.info(
+                "first update handled %.0f ms after start",
+                (self.first_handled_at - self.started_at) * 1000,
+            )
+
+    async def on_startup(self, _: web.Application) -> None:
+        self.warm_up()
+
+    async def on_cleanup(self, _: web.Application) -> None:
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._app is None or not self._app.done() or self._app.exception() is not None:
+            return
+        app = self._app.result()
+        for task in self._flushers:
+            task.cancel()
+        await app.close()
+        await app.bot.session.close()
+
+
+async def _prepare(settings: Settings, args: argparse.Namespace) -> None:
+    """Сетевые шаги деплоя: разрешение ссылок на каналы и регистрация webhook."""
+    from .handlers import _resolve_channel_link
+    from .main import build_application
+    from .storage import save_channel_meta
+
+    app = build_application(settings)
+    try:
+        if args.resolve_channels:
+            channels = await app.store.list_channels() or settings.required_channels
+            links = {}
+            for val in channels:
+                if val.lstrip("-").isdigit():
+                    links[val] = await _resolve_channel_link(app.bot, val)
+            save_channel_meta(settings.channel_meta_path, links)
+            logger.info("resolved %s channels into %s", len(links), settings.channel_meta_path)
+        if args.set_webhook:
+            await app.bot.set_webhook(
+                url=args.set_webhook,
+                secret_token=settings.webhook_secret or None,
+                allowed_updates=app.dispatcher.resolve_used_update_types(),
+            )
+            logger.info("webhook set to %s", args.set_webhook)
+    finally:
+        await app.store.close()
+        await app.bot.session.close()
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resolve-channels", action="store_true", help="записать ссылки на каналы в CHANNEL_META_PATH")
+    parser.add_argument("--set-webhook", metavar="URL", help="зарегистрировать webhook в Bot API")
+    args = parser.parse_args()
+    setup_logging()
+    settings = load_settings()
+    if args.resolve_channels or args.set_webhook:
+        asyncio.run(_prepare(settings, args))
+        return
+    worker = WebhookWorker(settings)
+    application = web.Application()
+    application.router.add_post(settings.webhook_path, worker.handle)
+    application.on_startup.append(worker.on_startup)
+    application.on_cleanup.append(worker.on_cleanup)
+    web.run_app(
+        application,
+        host=settings.webhook_host,
+        port=settings.webhook_port,
+        print=None,
+        loop=new_event_loop(settings.runtime_mode),
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1 @@
+"""Воспроизводимые замеры производительности бота (запуск: `python -m bench.<имя>`)."""
@@ -0,0 +1,81 @@
+"""Память на запись в кэшах обработчиков: строковые ключи против таблиц с целыми ключами.
+
+Запуск: `python -m bench.cache_memory [--users 1000000]`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Tuple
+
+from app.cache import ScopedCache, TTLKVCache, TTLMemoryCache
+
+
+CHAT_ID = -1003015322214
+BASE_USER_ID = 5_000_000_000
+
+
+def _measure(build: Callable[[int], Any], users: int) -> Tuple[float, Any]:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    holder = build(users)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / users, holder
+
+
+def legacy_layout(users: int) -> Dict[str, Any]:
+    """Прежняя схема: строковые ключи, float и кортеж (срок, значение)."""
+    now = time.monotonic()
+    welcomed: Dict[str, float] = {}
+    notices: Dict[str, float] = {}
+    last_notice: Dict[str, Tuple[float, Any]] = {}
+    for i in range(users):
+        uid = BASE_USER_ID + i
+        welcomed[f"welcomed:{CHAT_ID}:{uid}"] = now + 604800.0
+        notices[f"notice:{CHAT_ID}:{uid}"] = now + 10.0
+        last_notice[f"notice:{CHAT_ID}:{uid}"] = (now + 3600.0, 1_000_000 + i)
+    return {"welcomed": welcomed, "notice": notices, "last_notice": last_notice}
+
+
+def compact_layout(users: int) -> Dict[str, Any]:
+    """Текущая схема: таблица на chat_id, ключ — user_id, параллельные словари."""
+    now = time.monotonic()
+    welcomed: ScopedCache[TTLMemoryCache] = ScopedCache(TTLMemoryCache)
+    notices: ScopedCache[TTLMemoryCache] = ScopedCache(TTLMemoryCache)
+    last_notice: ScopedCache[TTLKVCache] = ScopedCache(TTLKVCache)
+    w = welcomed.table(CHAT_ID)._data
+    n = notices.table(CHAT_ID)._data
+    kv = last_notice.table(CHAT_ID)
+    for i in range(users):
+        uid = BASE_USER_ID + i
+        # Заполняем таблицы напрямую: замер памяти не должен зависеть от event loop
+        w[uid] = now + 604800.0
+        n[uid] = now + 10.0
+        kv._expires[uid] = now + 3600.0
+        kv._values[uid] = 1_000_000 + i
+    return {"welcomed": welcomed, "notice": notices, "last_notice": last_notice}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    legacy, holder = _measure(legacy_layout, args.users)
+    del holder
+    compact, holder = _measure(compact_layout, args.users)
+    del holder
+    print(f"users: {args.users}")
+    print(f"before (string keys): {legacy:8.1f} bytes/user")
+    print(f"after  (int tables):  {compact:8.1f} bytes/user")
+    print(f"saved: {100.0 * (1 - compact / legacy):.0f}%")
+
+
+if __name__ == "__main__":
+    main()
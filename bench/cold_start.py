@@ -0,0 +1,194 @@
+"""Холодный старт: время до первого обработанного обновления.
+
+Запуск: `python -m bench.cold_start`. Бенчмарк поднимает заглушку Bot API
+(с задержкой `--api-latency` на каждый вызов, имитирующей сеть),
+запускает бота отдельным процессом и отправляет ему сообщение от
+неподписанного пользователя. Обработанным считается обновление, по которому бот вызвал
+deleteMessage. Сравниваются два режима:
+
+- `polling` — `python -m app.main` (getMe, нормализация каналов через getChat, getUpdates);
+- `webhook` — `python -m app.webhook` (импорты в фоне, до готовности диспетчера — 503 и повтор доставки).
+
+Для webhook отдельно выводится время до подтверждения (HTTP 200).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import ClientError, ClientSession, web
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGET_CHAT_ID = -1001111111111
+CHANNELS = ["@channel_one", "-1002222222222"]
+USER = {"id": 42, "is_bot": False, "first_name": "U"}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _update() -> dict:
+    return {
+        "update_id": 1,
+        "message": {
+            "message_id": 10,
+            "date": int(time.time()),
+            "chat": {"id": TARGET_CHAT_ID, "type": "supergroup", "title": "g"},
+            "from": USER,
+            "text": "hi",
+        },
+    }
+
+
+class StubBotAPI:
+    """Минимальный Bot API: отвечает на вызовы бота и отмечает deleteMessage."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.deleted = asyncio.Event()
+        self.deleted_at = 0.0
+        self.calls: List[str] = []
+        self._update_sent = False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls.append(method)
+        await asyncio.sleep(self.latency)
+        if method == "getUpdates":
+            if not self._update_sent:
+                self._update_sent = True
+                return self._ok([_update()])
+            await asyncio.sleep(1.0)
+            return self._ok([])
+        if method == "deleteMessage":
+            if not self.deleted.is_set():
+                self.deleted_at = time.perf_counter()
+                self.deleted.set()
+            return self._ok(True)
+        if method == "getMe":
+            return self._ok({"id": 1, "is_bot": True, "first_name": "bot", "username": "bench_bot"})
+        if method == "getChat":
+            return self._ok({"id": -1002222222222, "type": "channel", "title": "c", "username": "channel_two",
+                             "accent_color_id": 0, "max_reaction_count": 1})
+        if method == "getChatMember":
+            return self._ok({"status": "left", "user": USER})
+        if method == "sendMessage":
+            return self._ok({"message_id": 500, "date": int(time.time()),
+                             "chat": {"id": TARGET_CHAT_ID, "type": "supergroup"}, "text": "x"})
+        return self._ok(True)
+
+    @staticmethod
+    def _ok(result: object) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+
+def _write_fixtures(tmp_dir: str) -> Dict[str, str]:
+    config_path = os.path.join(tmp_dir, "config.json")
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump({"chat_id": TARGET_CHAT_ID, "required_channels": CHANNELS}, f)
+    meta_path = os.path.join(tmp_dir, "channels_meta.json")
+    with open(meta_path, "w", encoding="utf-8") as f:
+        link = "https://t.me/channel_two"
+        json.dump({"-1002222222222": [f'<a href="{link}">@channel_two</a>', link]}, f)
+    return {"CONFIG_STORE_PATH": config_path, "CHANNEL_META_PATH": meta_path}
+
+
+async def _run_once(mode: str, latency: float, tmp_dir: str) -> Dict[str, Optional[float]]:
+    stub = StubBotAPI(latency)
+    server = web.Application()
+    server.router.add_route("*", "/bot{token}/{method}", stub.handle)
+    runner = web.AppRunner(server)
+    await runner.setup()
+    api_port = _free_port()
+    await web.TCPSite(runner, "127.0.0.1", api_port).start()
+
+    hook_port = _free_port()
+    env = dict(os.environ)
+    env.update(_write_fixtures(tmp_dir))
+    env.update({
+        "BOT_TOKEN": "1:bench",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{api_port}",
+        "WEBHOOK_HOST": "127.0.0.1",
+        "WEBHOOK_PORT": str(hook_port),
+        "WEBHOOK_SECRET": "",
+        "LOG_LEVEL": "WARNING",
+    })
+    module = "app.main" if mode == "polling" else "app.webhook"
+    started = time.perf_counter()
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", module, cwd=ROOT, env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    acked: Optional[float] = None
+    try:
+        if mode == "webhook":
+            async with ClientSession() as http:
+                while acked is None:
+                    try:
+                        async with http.post(f"http://127.0.0.1:{hook_port}/webhook", json=_update()) as resp:
+                            resp.raise_for_status()
+                            acked = time.perf_counter() - started
+                    except ClientError:
+                        await asyncio.sleep(0.005)
+        await asyncio.wait_for(stub.deleted.wait(), timeout=60)
+        handled: Optional[float] = stub.deleted_at - started
+    except asyncio.TimeoutError:
+        handled = None
+    finally:
+        if proc.returncode is None:
+            proc.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(proc.wait(), timeout=10)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+        await runner.cleanup()
+    return {"ack": acked, "handled": handled, "api_calls_before": float(stub.calls.index("deleteMessage"))
+            if "deleteMessage" in stub.calls else None}
+
+
+def _fmt(value: Optional[float]) -> str:
+    return f"{value * 1000:8.0f} мс" if value is not None else "       —"
+
+
+async def _main(args: argparse.Namespace) -> None:
+    print(f"задержка API {args.api_latency * 1000:.0f} мс, повторов {args.repeat} (медиана)")
+    for mode in args.modes:
+        results = []
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                results.append(await _run_once(mode, args.api_latency, tmp_dir))
+        handled = [r["handled"] for r in results if r["handled"] is not None]
+        acks = [r["ack"] for r in results if r["ack"] is not None]
+        calls = results[-1]["api_calls_before"]
+        print(
+            f"{mode:8} подтверждение {_fmt(statistics.median(acks) if acks else None)}"
+            f"  первый обработанный апдейт {_fmt(statistics.median(handled) if handled else None)}"
+            f"  вызовов API до удаления: {int(calls) if calls is not None else '—'}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Время холодного старта до первого обработанного апдейта")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--api-latency", type=float, default=0.05, help="задержка каждого вызова Bot API, сек")
+    parser.add_argument("--modes", nargs="+", choices=["polling", "webhook"], default=["polling", "webhook"])
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Время обработчиков, уходящее на логирование: до и после `app.logs`.
+
+Запуск: `python -m bench.logging_cost`. Имитирует рейд: `--messages`
+сообщений от разных неподписанных пользователей проходят через
+обработчики (заглушка Bot API из `bench.replay`), каждое даёт строки
+INFO о приветствии и напоминании. Сравниваются:
+
+- `basicConfig` — синхронный StreamHandler, запись в event loop (как было);
+- `queue` — `setup_logging()`: фильтр частоты и QueueHandler, запись в фоновом потоке.
+
+Вывод идёт в файл; `--sink-delay` добавляет задержку на каждую запись,
+имитируя медленный приёмник (терминал, journald, переполненный pipe).
+Без логирования (`off`) — нижняя граница времени обработчиков.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import IO
+
+from aiogram.types import Update
+
+from app.config import Settings
+from app.logs import LOG_FORMAT, setup_logging, stop_logging
+from app.main import build_application
+from bench.replay import StubSession
+
+
+TARGET_CHAT_ID = -1001111111111
+
+
+class _SlowStream:
+    """Файл, каждая запись в который занимает `delay` секунд."""
+
+    def __init__(self, target: IO[str], delay: float) -> None:
+        self.target = target
+        self.delay = delay
+
+    def write(self, data: str) -> int:
+        if self.delay > 0:
+            time.sleep(self.delay)
+        return self.target.write(data)
+
+    def flush(self) -> None:
+        self.target.flush()
+
+
+async def _run(app, mode: str, messages: int, first_user: int, stream: _SlowStream) -> float:
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    listener = None
+    if mode == "basicConfig":
+        logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, stream=stream, force=True)
+    elif mode == "queue":
+        listener = setup_logging("INFO", stream=stream)
+    else:
+        root.setLevel(logging.WARNING)
+
+    spent = 0.0
+    for i in range(messages):
+        update = Update.model_validate(
+            {
+                "update_id": i,
+                "message": {
+                    "message_id": i,
+                    "date": int(time.time()),
+                    "chat": {"id": TARGET_CHAT_ID, "type": "supergroup", "title": "g"},
+                    "from": {"id": first_user + i, "is_bot": False, "first_name": "U"},
+                    "text": "spam",
+                },
+            },
+            context={"bot": app.bot},
+        )
+        started = time.perf_counter()
+        await app.dispatcher.feed_update(app.bot, update)
+        spent += time.perf_counter() - started
+    # Отложенные автоудаления в замер не входят
+    for task in asyncio.all_tasks() - {asyncio.current_task()}:
+        task.cancel()
+    if listener is not None:
+        stop_logging(listener)
+    return spent
+
+
+async def _main(args: argparse.Namespace) -> None:
+    modes = ["off", "basicConfig", "queue"]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = os.path.join(tmp_dir, "config.json")
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump({"chat_id": TARGET_CHAT_ID, "required_channels": ["@bench_channel"]}, f)
+        settings = Settings(
+            bot_token="1:bench",
+            required_channels=[],
+            chat_id=TARGET_CHAT_ID,
+            config_store_path=config_path,
+            participants_path=os.path.join(tmp_dir, "participants.txt"),
+            audit_state_path=os.path.join(tmp_dir, "audit_state.json"),
+            overload_enabled=False,
+            catchup_threshold_seconds=0,
+        )
+        # Все пользователи не подписаны: приветствие, удаление и напоминание на каждого
+        app = build_application(settings, session=StubSession(subscribed_share=0.0))
+        with open(os.path.join(tmp_dir, "log.txt"), "w", encoding="utf-8") as sink:
+            stream = _SlowStream(sink, args.sink_delay)
+            for idx, mode in enumerate(modes):
+                # Кэши обработчиков общие на процесс: у каждого режима свои пользователи
+                results[mode] = await _run(app, mode, args.messages, 10_000_000 * (idx + 1), stream)
+        await app.store.close()
+    baseline = results["off"]
+    print(f"сообщений: {args.messages}, задержка записи: {args.sink_delay * 1000:.1f} мс")
+    for mode in modes:
+        total = results[mode]
+        print(
+            f"{mode:12} {total * 1000:9.1f} мс в обработчиках, "
+            f"{total / args.messages * 1e6:8.1f} мкс/сообщение, "
+            f"на логирование ~{max(total - baseline, 0.0) * 1000:8.1f} мс"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Доля логирования во времени обработчиков")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--sink-delay", type=float, default=0.0005, help="задержка одной записи в лог, сек")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
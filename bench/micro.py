@@ -0,0 +1,206 @@
+"""Микробенчмарки горячего пути с бюджетами относительно сохранённой базы.
+
+Запуск: `python -m bench.micro` — сравнить с `bench/baseline.json`
+и завершиться с кодом 1, если операция стала медленнее базы больше,
+чем в `budget` раз. `--update-baseline` перезаписывает базу текущими
+замерами (делайте это на той же машине, где потом сравниваете).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from app.cache import TTLKVCache, TTLMemoryCache
+from app.handlers import _channel_links, _is_target_chat, render_reminder
+from app.keyboards import subscription_keyboard
+from app.storage import ConfigStore
+from app.subscription import SubscriptionService
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_BUDGET = 2.0
+
+# Реалистичные размеры: сотни тысяч пользователей в кэше, 5 обязательных каналов
+CACHE_ENTRIES = 200_000
+CHANNELS = ["@channel_one", "@channel_two", "@channel_three", "-1001234567890", "-1009876543210"]
+TARGET_CHAT_ID = -1003015322214
+
+Op = Callable[[], Union[None, Awaitable[None]]]
+
+
+class _StubBot:
+    """Bot с мгновенными ответами getChatMember (статус member)."""
+
+    id = 1
+
+    def __init__(self) -> None:
+        self.member = SimpleNamespace(status="member", is_member=True)
+
+    async def get_chat_member(self, chat_id: str, user_id: int) -> SimpleNamespace:
+        return self.member
+
+
+async def _build_cases(tmp_dir: str) -> Dict[str, Tuple[Op, bool]]:
+    """Имя → (операция, асинхронная ли она)."""
+    memory = TTLMemoryCache()
+    kv = TTLKVCache()
+    for uid in range(CACHE_ENTRIES):
+        await memory.set_until(uid, 3600)
+        await kv.set(uid, uid, 3600)
+    hit_key = CACHE_ENTRIES // 2
+
+    store_path = os.path.join(tmp_dir, "config.json")
+    with open(store_path, "w", encoding="utf-8") as f:
+        json.dump({"chat_id": TARGET_CHAT_ID, "required_channels": CHANNELS}, f)
+    store = ConfigStore(store_path)
+
+    bot = _StubBot()
+    subs_hit = SubscriptionService(bot, CHANNELS, ttl_seconds=3600)  # type: ignore[arg-type]
+    await subs_hit.store_verdict(42, True)
+    subs_miss = SubscriptionService(bot, CHANNELS, ttl_seconds=0)  # type: ignore[arg-type]
+
+    # Числовые каналы заранее разрешены: замеряем рендер, а не сеть
+    for val in CHANNELS:
+        if val.lstrip("-").isdigit():
+            await _channel_links.set(val, (f'<a href="https://t.me/+{val}">канал</a>', f"https://t.me/+{val}"), 3600)
+    user = SimpleNamespace(id=42, full_name="Иван <Тест>", first_name="Иван")
+    urls = [f"https://t.me/{c.lstrip('@')}" for c in CHANNELS]
+    short_target = int("-" + str(abs(TARGET_CHAT_ID))[3:])
+
+    async def set_until() -> None:
+        await memory.set_until(hit_key, 3600)
+
+    async def contains() -> None:
+        await memory.contains(hit_key)
+
+    async def kv_get() -> None:
+        await kv.get(hit_key)
+
+    async def get_chat_id() -> None:
+        await store.get_chat_id()
+
+    async def list_channels() -> None:
+        await store.list_channels()
+
+    async def subscribed_hit() -> None:
+        await subs_hit.is_fully_subscribed(42)
+
+    async def subscribed_miss() -> None:
+        await subs_miss.is_fully_subscribed(43)
+
+    async def reminder() -> None:
+        await render_reminder(bot, user, CHANNELS)  # type: ignore[arg-type]
+
+    return {
+        "is_target_chat.exact": (lambda: _is_target_chat(TARGET_CHAT_ID, TARGET_CHAT_ID) and None, False),
+        "is_target_chat.variant": (lambda: _is_target_chat(TARGET_CHAT_ID, short_target) and None, False),
+        "is_target_chat.miss": (lambda: _is_target_chat(-1001111111111, TARGET_CHAT_ID) and None, False),
+        "ttl_memory.set_until": (set_until, True),
+        "ttl_memory.contains": (contains, True),
+        "ttl_kv.get": (kv_get, True),
+        "config_store.get_chat_id": (get_chat_id, True),
+        "config_store.list_channels": (list_channels, True),
+        "subscription.cache_hit": (subscribed_hit, True),
+        "subscription.cache_miss": (subscribed_miss, True),
+        "render_reminder": (reminder, True),
+        "subscription_keyboard": (lambda: subscription_keyboard(urls) and None, False),
+    }
+
+
+async def _time_op(op: Op, is_async: bool, repeat: int, min_time: float) -> float:
+    """Лучшее время одной операции (нс) из `repeat` серий по >= `min_time` секунд."""
+    # Подбираем число итераций так, чтобы серия шла не меньше min_time
+    loops = 1
+    while True:
+        elapsed = await _run(op, is_async, loops)
+        if elapsed >= min_time:
+            break
+        loops *= 2
+    best = elapsed / loops
+    for _ in range(repeat - 1):
+        best = min(best, await _run(op, is_async, loops) / loops)
+    return best * 1e9
+
+
+async def _run(op: Op, is_async: bool, loops: int) -> float:
+    start = time.perf_counter()
+    if is_async:
+        for _ in range(loops):
+            await op()  # type: ignore[misc]
+    else:
+        for _ in range(loops):
+            op()
+    return time.perf_counter() - start
+
+
+def _load_baseline(path: str) -> Dict[str, object]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+async def run(names: Optional[List[str]], repeat: int, min_time: float) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cases = await _build_cases(tmp_dir)
+        results: Dict[str, float] = {}
+        for name, (op, is_async) in cases.items():
+            if names and not any(name.startswith(n) for n in names):
+                continue
+            results[name] = await _time_op(op, is_async, repeat, min_time)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("names", nargs="*", help="префиксы имён бенчмарков")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--budget", type=float, default=None, help="допустимое замедление относительно базы")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.names, args.repeat, args.min_time))
+    baseline = _load_baseline(args.baseline)
+    base_results: Dict[str, float] = dict(baseline.get("results", {}))  # type: ignore[arg-type]
+    budgets: Dict[str, float] = dict(baseline.get("budgets", {}))  # type: ignore[arg-type]
+    default_budget = args.budget or float(baseline.get("budget", DEFAULT_BUDGET))  # type: ignore[arg-type]
+
+    failed: List[str] = []
+    for name, ns in results.items():
+        base = base_results.get(name)
+        if base is None:
+            print(f"{name:32s} {ns:12.0f} ns/op   (нет базы)")
+            continue
+        budget = args.budget or budgets.get(name, default_budget)
+        ratio = ns / base
+        mark = "OK" if ratio <= budget else "REGRESSION"
+        print(f"{name:32s} {ns:12.0f} ns/op   x{ratio:5.2f} от базы {base:.0f} (бюджет x{budget:.2f}) {mark}")
+        if ratio > budget:
+            failed.append(name)
+
+    if args.update_baseline:
+        base_results.update({name: round(ns, 1) for name, ns in results.items()})
+        baseline = {"budget": default_budget, "budgets": budgets, "results": base_results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline updated: {args.baseline}")
+        return 0
+    if failed:
+        print("Превышен бюджет: " + ", ".join(failed))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,229 @@
+"""Воспроизведение записанных апдейтов через Dispatcher против заглушки Bot API.
+
+Запись делает сам бот при `CAPTURE_DIR=...` (см. `app.capture`). Запуск:
+
+    python -m bench.replay data/capture --speed 1     # исходный темп
+    python -m bench.replay data/capture --speed 10    # в 10 раз быстрее
+    python -m bench.replay data/capture --speed 0     # так быстро, как возможно
+
+Бот собирается так же, как в `app.main`, но с HTTP-сессией-заглушкой:
+вызовы API не уходят в сеть, отвечают через `--api-latency` секунд
+и считаются по апдейту, который их вызвал. Подписан ли пользователь,
+решается детерминированно по его (хешированному) ID и `--subscribed`.
+Даты событий сдвигаются к текущему времени с сохранением исходного
+отставания, чтобы режим догоняния и контроль перегрузки вели себя как в проде.
+Итог: задержка обработки (p50/p95/p99/max) и вызовы API на апдейт по типам.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import (
+    ChatFullInfo,
+    ChatInviteLink,
+    ChatMemberLeft,
+    ChatMemberMember,
+    Message,
+    Update,
+    User,
+)
+
+from app.capture import read_capture
+from app.config import Settings
+from app.main import build_application
+
+
+_current_calls: contextvars.ContextVar[Optional[Counter]] = contextvars.ContextVar("replay_calls", default=None)
+_EVENT_FIELDS = ("message", "edited_message", "chat_member", "my_chat_member")
+
+
+class StubSession(BaseSession):
+    """HTTP-сессия без сети: правдоподобные ответы и подсчёт вызовов."""
+
+    def __init__(self, latency: float = 0.0, subscribed_share: float = 0.5) -> None:
+        super().__init__()
+        self.latency = latency
+        self.subscribed_share = subscribed_share
+        self.calls: Counter = Counter()
+        self._message_id = 1_000_000
+
+    def is_subscribed(self, user_id: int) -> bool:
+        return (user_id * 2654435761 % 2 ** 32) / 2 ** 32 < self.subscribed_share
+
+    async def make_request(
+        self, bot: Bot, method: TelegramMethod[TelegramType], timeout: Optional[int] = None
+    ) -> TelegramType:
+        name = method.__api_method__
+        self.calls[name] += 1
+        per_update = _current_calls.get()
+        if per_update is not None:
+            per_update[name] += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        return self._answer(name, method)  # type: ignore[return-value]
+
+    def _answer(self, name: str, method: Any) -> Any:
+        if name == "getChatMember":
+            user = User(id=method.user_id, is_bot=False, first_name="user")
+            if self.is_subscribed(method.user_id):
+                return ChatMemberMember(user=user)
+            return ChatMemberLeft(user=user)
+        if name == "sendMessage":
+            self._message_id += 1
+            return Message(
+                message_id=self._message_id,
+                date=int(time.time()),
+                chat={"id": method.chat_id, "type": "supergroup"},
+                text=method.text,
+            )
+        if name == "getChat":
+            return ChatFullInfo(id=int(method.chat_id), type="channel", title="channel", accent_color_id=0, max_reaction_count=0)
+        if name == "createChatInviteLink":
+            return ChatInviteLink(
+                invite_link="https://t.me/+replay", creator=User(id=1, is_bot=True, first_name="bot"),
+                creates_join_request=False, is_primary=False, is_revoked=False,
+            )
+        if name == "exportChatInviteLink":
+            return "https://t.me/+replay"
+        if name == "getMe":
+            return User(id=1, is_bot=True, first_name="bot", username="replay_bot")
+        return True
+
+    async def close(self) -> None:
+        pass
+
+    async def stream_content(self, *args: Any, **kwargs: Any) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+
+def _rebase_dates(raw: Dict[str, Any], shift: float) -> str:
+    """Сдвинуть даты события на `shift` секунд; вернуть тип апдейта."""
+    for field in _EVENT_FIELDS:
+        event = raw.get(field)
+        if isinstance(event, dict):
+            for key in ("date", "edit_date"):
+                if isinstance(event.get(key), int):
+                    event[key] = int(event[key] + shift)
+            return field
+    return "other"
+
+
+def _guess_chat_id(records: List[tuple]) -> Optional[int]:
+    chats: Counter = Counter()
+    for _, raw in records:
+        for field in ("message", "edited_message"):
+            chat = (raw.get(field) or {}).get("chat") or {}
+            if chat.get("type") in {"group", "supergroup"}:
+                chats[chat["id"]] += 1
+    return chats.most_common(1)[0][0] if chats else None
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def replay(args: argparse.Namespace) -> None:
+    records = list(read_capture(args.capture))
+    if args.limit:
+        records = records[: args.limit]
+    if not records:
+        raise SystemExit(f"в {args.capture} нет записанных апдейтов")
+    chat_id = args.chat_id if args.chat_id is not None else _guess_chat_id(records)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = os.path.join(tmp_dir, "config.json")
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump({"chat_id": chat_id, "required_channels": args.channels}, f)
+        settings = Settings(
+            bot_token="1:replay",
+            required_channels=list(args.channels),
+            chat_id=chat_id,
+            config_store_path=config_path,
+            participants_path=os.path.join(tmp_dir, "participants.txt"),
+            audit_state_path=os.path.join(tmp_dir, "audit_state.json"),
+        )
+        session = StubSession(latency=args.api_latency, subscribed_share=args.subscribed)
+        app = build_application(settings, session=session)
+
+        latencies: List[float] = []
+        by_type: Dict[str, List[Counter]] = defaultdict(list)
+
+        async def feed(raw: Dict[str, Any], kind: str) -> None:
+            calls: Counter = Counter()
+            _current_calls.set(calls)
+            update = Update.model_validate(raw, context={"bot": app.bot})
+            started = time.perf_counter()
+            try:
+                await app.dispatcher.feed_update(app.bot, update)
+            finally:
+                latencies.append(time.perf_counter() - started)
+                by_type[kind].append(calls)
+
+        first_t = records[0][0]
+        wall_start = time.perf_counter()
+        pending: List[asyncio.Task] = []
+        for received, raw in records:
+            if args.speed > 0:
+                due = wall_start + (received - first_t) / args.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            # Исходное отставание (время получения минус дата события) сохраняется
+            kind = _rebase_dates(raw, time.time() - received)
+            if args.speed > 0:
+                pending.append(asyncio.create_task(feed(raw, kind)))
+            else:
+                await feed(raw, kind)
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        wall = time.perf_counter() - wall_start
+        await app.store.close()
+
+    # Отложенные автоудаления (через ~20 с) в замер не входят
+    for task in asyncio.all_tasks() - {asyncio.current_task()}:
+        task.cancel()
+
+    total = sum(session.calls.values())
+    print(f"апдейтов: {len(latencies)}, время: {wall:.2f} с ({len(latencies) / wall:.0f}/с), чат {chat_id}")
+    print(
+        "задержка обработки: "
+        f"p50 {_percentile(latencies, 0.5) * 1000:.2f} мс, p95 {_percentile(latencies, 0.95) * 1000:.2f} мс, "
+        f"p99 {_percentile(latencies, 0.99) * 1000:.2f} мс, max {max(latencies) * 1000:.2f} мс"
+    )
+    print(f"вызовов API: {total} ({total / len(latencies):.2f} на апдейт)")
+    for name, count in session.calls.most_common():
+        print(f"  {name:24} {count:8} ({count / len(latencies):.3f} на апдейт)")
+    print("по типам апдейтов:")
+    for kind, counters in sorted(by_type.items()):
+        calls = sum(sum(c.values()) for c in counters)
+        print(f"  {kind:24} {len(counters):8} апдейтов, {calls / len(counters):.2f} вызовов на апдейт")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Воспроизведение записи апдейтов против заглушки Bot API")
+    parser.add_argument("capture", help="каталог с capture-*.jsonl.gz")
+    parser.add_argument("--speed", type=float, default=0.0, help="1 — исходный темп, N — в N раз быстрее, 0 — без пауз")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка каждого вызова API, сек")
+    parser.add_argument("--subscribed", type=float, default=0.5, help="доля подписанных пользователей")
+    parser.add_argument("--chat-id", type=int, default=None, help="целевой чат (по умолчанию — самый частый в записи)")
+    parser.add_argument("--channels", nargs="+", default=["@replay_channel"], help="обязательные каналы")
+    parser.add_argument("--limit", type=int, default=0, help="воспроизвести только первые N апдейтов")
+    asyncio.run(replay(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
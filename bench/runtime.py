@@ -0,0 +1,155 @@
+"""Пропускная способность и p99 обработки апдейтов в разных режимах цикла событий.
+
+Запуск: `python -m bench.runtime`. Каждый режим (`asyncio`, `eager`,
+`uvloop`, `uvloop+eager`) запускается в отдельном процессе с одинаковой
+синтетической нагрузкой. Апдейты приходят пачками по `--batch` штук, как из
+getUpdates, и каждый обрабатывается своей задачей, как в aiogram
+(`handle_as_tasks`). Большинство авторов подписаны, их вердикт уже в кэше.
+Остальные получают удаление и напоминание через заглушку Bot API
+с задержкой `--api-latency`. Недоступные режимы (нет uvloop или
+Python < 3.12 для eager) помечаются и пропускаются.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from aiogram import Bot
+from aiogram.types import Update
+
+from app import runtime
+from app.config import Settings
+from app.main import build_application
+from bench.replay import StubSession
+
+
+TARGET_CHAT_ID = -1001111111111
+MODES = ("asyncio", "eager", "uvloop", "uvloop+eager")
+
+
+def _unavailable_reason(mode: str) -> str:
+    if "uvloop" in mode and not runtime.uvloop_available():
+        return "uvloop не установлен"
+    if "eager" in mode and not runtime.eager_available():
+        return f"нужен Python 3.12+, сейчас {sys.version.split()[0]}"
+    return ""
+
+
+async def _load(args: argparse.Namespace) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = os.path.join(tmp_dir, "config.json")
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump({"chat_id": TARGET_CHAT_ID, "required_channels": ["@bench_channel"]}, f)
+        settings = Settings(
+            bot_token="1:bench",
+            required_channels=[],
+            chat_id=TARGET_CHAT_ID,
+            config_store_path=config_path,
+            participants_path=os.path.join(tmp_dir, "participants.txt"),
+            audit_state_path=os.path.join(tmp_dir, "audit_state.json"),
+            overload_enabled=False,
+            catchup_threshold_seconds=0,
+        )
+        session = StubSession(latency=args.api_latency, subscribed_share=args.subscribed)
+        app = build_application(settings, session=session)
+        users = list(range(1, args.users + 1))
+        # Прогрев: вердикты подписанных попадают в кэш, все уже поприветствованы
+        for uid in users:
+            await app.dispatcher.feed_update(app.bot, _update(app.bot, uid, uid))
+
+        latencies: List[float] = []
+
+        async def handle(update: Update) -> None:
+            started = time.perf_counter()
+            await app.dispatcher.feed_update(app.bot, update)
+            latencies.append(time.perf_counter() - started)
+
+        updates = [
+            _update(app.bot, users[i % len(users)], args.users + i) for i in range(args.updates)
+        ]
+        wall_start = time.perf_counter()
+        for start in range(0, len(updates), args.batch):
+            batch = [asyncio.create_task(handle(u)) for u in updates[start:start + args.batch]]
+            await asyncio.gather(*batch)
+        wall = time.perf_counter() - wall_start
+        for task in asyncio.all_tasks() - {asyncio.current_task()}:
+            task.cancel()
+        await app.store.close()
+
+    latencies.sort()
+    return {
+        "rate": len(latencies) / wall,
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+    }
+
+
+def _update(bot: Bot, user_id: int, update_id: int) -> Update:
+    return Update.model_validate(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": TARGET_CHAT_ID, "type": "supergroup", "title": "g"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "U"},
+                "text": "hi",
+            },
+        },
+        context={"bot": bot},
+    )
+
+
+def _child(args: argparse.Namespace) -> None:
+    result = runtime.run(_load(args), args.child)
+    print(json.dumps(result))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сравнение режимов цикла событий под одинаковой нагрузкой")
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=100, help="апдейтов в пачке (как limit у getUpdates)")
+    parser.add_argument("--subscribed", type=float, default=0.95, help="доля подписанных авторов")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка вызова Bot API, сек")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args)
+        return
+
+    print(
+        f"апдейтов {args.updates}, авторов {args.users}, подписаны {args.subscribed:.0%}, "
+        f"пачка {args.batch}, задержка API {args.api_latency * 1000:.0f} мс"
+    )
+    for mode in args.modes:
+        reason = _unavailable_reason(mode)
+        if reason:
+            print(f"{mode:14} недоступен: {reason}")
+            continue
+        child_args = [
+            "--updates", str(args.updates), "--users", str(args.users), "--batch", str(args.batch),
+            "--subscribed", str(args.subscribed), "--api-latency", str(args.api_latency), "--child", mode,
+        ]
+        output = subprocess.run(
+            [sys.executable, "-m", "bench.runtime", *child_args],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{mode:14} {result['rate']:9.0f} апдейтов/с  "
+            f"p50 {result['p50'] * 1e6:8.0f} мкс  p99 {result['p99'] * 1e6:8.0f} мкс"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Поведение обработчиков на ступени CACHED_ONLY (без сети: заглушка Bot API)."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import List
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.types import ChatMemberMember, Message, Update, User
+
+from app.config import Settings
+from app.handlers import setup_handlers
+from app.overload import CACHED_ONLY, OverloadController
+from app.storage import ConfigStore
+from app.subscription import SubscriptionService
+
+
+TARGET_CHAT_ID = -1001111111111
+
+
+class _StubSession(BaseSession):
+    """Отвечает на вызовы Bot API без сети и запоминает имена методов."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls: List[str] = []
+
+    async def close(self) -> None:
+        pass
+
+    async def stream_content(self, *args, **kwargs):  # pragma: no cover - не используется
+        yield b""
+
+    async def make_request(self, bot, method, timeout=None):
+        name = method.__api_method__
+        self.calls.append(name)
+        if name == "getChatMember":
+            return ChatMemberMember(user=User(id=method.user_id, is_bot=False, first_name="U"))
+        if name == "sendMessage":
+            return Message.model_validate(
+                {"message_id": 1, "date": int(time.time()), "chat": {"id": method.chat_id, "type": "supergroup"}}
+            )
+        return True
+
+
+def _message(user_id: int, message_id: int) -> Update:
+    return Update.model_validate(
+        {
+            "update_id": message_id,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": TARGET_CHAT_ID, "type": "supergroup", "title": "g"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "U"},
+                "text": "hi",
+            },
+        }
+    )
+
+
+def test_unknown_user_is_deleted_in_cached_only(tmp_path) -> None:
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"chat_id": TARGET_CHAT_ID, "required_channels": ["@chan"]}))
+
+    async def scenario() -> List[str]:
+        session = _StubSession()
+        bot = Bot("1:test", session=session)
+        settings = Settings(bot_token="1:test", required_channels=[], chat_id=TARGET_CHAT_ID, config_store_path=str(config_path))
+        store = ConfigStore(str(config_path))
+        # Политика allow не должна пропускать неизвестных при перегрузке
+        subs = SubscriptionService(bot, [], 10, store=store, fail_policy="allow")
+        overload = OverloadController()
+        overload.stage = CACHED_ONLY
+        dispatcher = Dispatcher()
+        dispatcher.include_router(setup_handlers(settings, subs, None, overload, store))
+        await dispatcher.feed_update(bot, _message(user_id=42, message_id=7))
+        for task in asyncio.all_tasks() - {asyncio.current_task()}:
+            task.cancel()
+        await store.close()
+        return session.calls
+
+    calls = asyncio.run(scenario())
+    assert calls == ["deleteMessage"]